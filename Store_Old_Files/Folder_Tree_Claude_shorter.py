@@ -6,12 +6,31 @@ Compatible with Python 3.7+
 """
 
 import os
+import re
 import sys
+import time
+import errno
+import fnmatch
+import heapq
+import itertools
+import math
+import mmap
 import argparse
+import hashlib
+import shutil
 from pathlib import Path
-from typing import Dict, List, Set, Optional, Tuple
+from typing import Callable, Dict, Iterable, Iterator, List, Sequence, Set, Optional, Tuple, Union
 from datetime import datetime
 import json
+import sqlite3
+import threading
+import ctypes
+import ctypes.util
+import select
+import struct
+from array import array
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, Future
+from contextlib import ExitStack
 
 # For image generation
 try:
@@ -31,6 +50,39 @@ try:
 except ImportError:
     REPORTLAB_AVAILABLE = False
 
+def classify_entry(entry: os.DirEntry) -> Optional[bool]:
+    """Return True for a directory, False for a file, None for anything else (broken links, fifos...)"""
+    try:
+        if entry.is_dir():
+            return True
+        if entry.is_file():
+            return False
+    except OSError:
+        pass
+    return None
+
+# A node record as produced by the walk: (depth, kind, name, size, flags)
+Node = Tuple[int, int, str, int, int]
+
+# A filtered directory listing: (directories, displayed files, hidden file count,
+# hidden files - only collected when their sizes are needed)
+Listing = Tuple[List[os.DirEntry], List[os.DirEntry], int, List[os.DirEntry]]
+
+# One child's share of its folder's Merkle hash: name, then NUL, kind, size (a
+# folder's own hash) and mtime (for a truncation marker: hidden count and size)
+_STAMP = struct.Struct('<xBQd')
+
+def _stamp(name: str, kind: int, value: int, mtime: float = 0.0) -> bytes:
+    return name.encode('utf-8', 'surrogateescape') + _STAMP.pack(kind, value, mtime)
+
+def _collect(items: Iterator, out: List):
+    """Drain a generator into out and return the generator's return value"""
+    while True:
+        try:
+            out.append(next(items))
+        except StopIteration as stop:
+            return stop.value
+
 class FileTypeIcons:
     """File type icons - emoji for artisanal, fallback symbols for compatibility"""
     
@@ -70,7 +122,7 @@ class FileTypeIcons:
         
         # Archives
         '.zip': '🗜️', '.rar': '🗜️', '.7z': '🗜️', '.tar': '🗜️', '.gz': '🗜️',
-        '.bz2': '🗜️', '.xz': '🗜️',
+        '.bz2': '🗜️', '.xz': '🗜️', '.tar.gz': '🗜️', '.tar.bz2': '🗜️', '.tar.xz': '🗜️',
         
         # Executables
         '.exe': '⚙️', '.msi': '📦', '.deb': '📦', '.rpm': '📦', '.dmg': '📦',
@@ -97,7 +149,7 @@ class FileTypeIcons:
         '.jpg': '[IMG]', '.jpeg': '[IMG]', '.png': '[IMG]', '.gif': '[GIF]',
         '.mp3': '[MP3]', '.wav': '[WAV]', '.mp4': '[MP4]', '.avi': '[AVI]',
         '.py': '[PY]', '.js': '[JS]', '.html': '[HTM]', '.css': '[CSS]',
-        '.zip': '[ZIP]', '.rar': '[RAR]',
+        '.zip': '[ZIP]', '.rar': '[RAR]', '.tar.gz': '[TGZ]', '.tar.bz2': '[TBZ]', '.tar.xz': '[TXZ]',
         'folder': '[DIR]', 'file': '[   ]', 'unknown': '[?]'
     }
 
@@ -135,17 +187,1376 @@ class TreeStyle:
         }
     }
 
+class PatternMatcher:
+    """Exclude patterns compiled once into a single matcher.
+    
+    - plain text matches anywhere in an entry name (e.g. "cache")
+    - globs (containing * ? or [) match the whole name (e.g. "*.pyc")
+    - "re:<regex>" is searched in the name (e.g. "re:^tmp\\d+$")
+    - patterns containing a slash are paths relative to the scanned root
+      (e.g. "docs/_build"); excluded folders are never descended into, so
+      only the exact relative path needs checking
+    
+    Plain text and glob rules are combined into one regular expression, so
+    they cost one regex search per entry however many there are. Each "re:"
+    rule is compiled on its own, so its flags and groups work as written.
+    """
+    
+    GLOB_CHARS = frozenset('*?[')
+    
+    def __init__(self, patterns: Iterable[str], root: Union[str, Path, None] = None):
+        name_rules = []
+        regexes = []
+        paths = set()
+        for pattern in patterns:
+            if pattern.startswith('re:'):
+                try:
+                    regexes.append(re.compile(pattern[3:]).search)
+                except re.error as e:
+                    raise ValueError(f"Invalid exclude pattern {pattern!r}: {e}") from None
+            elif '/' in pattern or '\\' in pattern:
+                paths.add(os.path.normpath(pattern.strip('/\\')))
+            elif self.GLOB_CHARS.intersection(pattern):
+                name_rules.append('^' + fnmatch.translate(pattern))
+            else:
+                name_rules.append(re.escape(pattern))
+        
+        self._search = re.compile('|'.join(f'(?:{rule})' for rule in name_rules)).search if name_rules else None
+        self._regexes = tuple(regexes)
+        self._paths = frozenset(paths)
+        self.root = os.path.join(os.fspath(root), '') if root is not None else None
+    
+    def matches(self, name: str, path: Optional[str] = None) -> bool:
+        """True if an entry (its name, and optionally its full path) is excluded"""
+        if self._search is not None and self._search(name):
+            return True
+        for search in self._regexes:
+            if search(name):
+                return True
+        if self._paths and path is not None and self.root is not None and path.startswith(self.root):
+            return path[len(self.root):] in self._paths
+        return False
+
+class GitIgnore:
+    """Compiled rules of one .gitignore (or .treeignore) file.
+    
+    Follows the gitignore syntax: comments, "!" negation, trailing "/" for
+    folders only, patterns with a slash anchored to the file's folder, and
+    "*", "?", "[...]" and "**" wildcards. Consecutive rules of the same kind
+    are joined into one regular expression.
+    """
+    
+    def __init__(self, base: str, lines: Iterable[str]):
+        self.base = os.path.join(base, '')
+        self.groups: List[Tuple['re.Pattern', bool, bool]] = []
+        
+        pending: List[str] = []
+        pending_kind = None
+        for line in lines:
+            rule = self._parse(line)
+            if rule is None:
+                continue
+            regex, negate, dir_only = rule
+            if (negate, dir_only) != pending_kind and pending:
+                self.groups.append((re.compile('|'.join(pending)),) + pending_kind)
+                pending = []
+            pending_kind = (negate, dir_only)
+            pending.append(regex)
+        if pending:
+            self.groups.append((re.compile('|'.join(pending)),) + pending_kind)
+    
+    @classmethod
+    def load(cls, path: str, base: str) -> Optional['GitIgnore']:
+        """Read and compile an ignore file, or return None if there is none"""
+        try:
+            with open(path, encoding='utf-8', errors='replace') as f:
+                return cls(base, f.read().splitlines())
+        except OSError:
+            return None
+    
+    @staticmethod
+    def _parse(line: str) -> Optional[Tuple[str, bool, bool]]:
+        """Turn one line into (regex, negate, dir_only), or None for blanks and comments"""
+        if not line.endswith('\\ '):
+            line = line.rstrip(' ')
+        if not line or line.startswith('#'):
+            return None
+        negate = line.startswith('!')
+        if negate:
+            line = line[1:]
+        if line.startswith('\\'):
+            line = line[1:]
+        dir_only = line.endswith('/')
+        line = line.rstrip('/')
+        if not line:
+            return None
+        
+        # A slash anywhere but the end anchors the pattern to this folder
+        anchored = '/' in line
+        line = line.lstrip('/')
+        
+        parts = []
+        i, n = 0, len(line)
+        while i < n:
+            if line.startswith('**/', i):
+                parts.append('(?:.*/)?')
+                i += 3
+            elif line.startswith('**', i):
+                parts.append('.*')
+                i += 2
+            elif line[i] == '*':
+                parts.append('[^/]*')
+                i += 1
+            elif line[i] == '?':
+                parts.append('[^/]')
+                i += 1
+            elif line[i] == '[' and ']' in line[i + 2:]:
+                end = line.index(']', i + 2)
+                chars = line[i + 1:end]
+                if chars.startswith('!'):
+                    chars = '^' + chars[1:]
+                parts.append('[' + chars.replace('\\', '\\\\') + ']')
+                i = end + 1
+            elif line[i] == '\\' and i + 1 < n:
+                parts.append(re.escape(line[i + 1]))
+                i += 2
+            else:
+                parts.append(re.escape(line[i]))
+                i += 1
+        
+        return ('' if anchored else '(?:.*/)?') + ''.join(parts) + '$', negate, dir_only
+    
+    def match(self, path: str, is_dir: bool) -> Optional[bool]:
+        """True if ignored, False if re-included by a "!" rule, None if no rule matches"""
+        relative = path[len(self.base):]
+        if os.sep != '/':
+            relative = relative.replace(os.sep, '/')
+        for pattern, negate, dir_only in reversed(self.groups):
+            if dir_only and not is_dir:
+                continue
+            if pattern.match(relative):
+                return not negate
+        return None
+
+def is_ignored(rules: Sequence[GitIgnore], path: str, is_dir: bool) -> bool:
+    """Check a path against ignore files ordered outermost first (deeper files win)"""
+    for ignore_file in reversed(rules):
+        result = ignore_file.match(path, is_dir)
+        if result is not None:
+            return result
+    return False
+
+class CachedEntry:
+    """Stand-in for os.DirEntry rebuilt from a cached listing"""
+    
+    __slots__ = ('name', 'path', '_is_dir', '_stat')
+    
+    def __init__(self, name: str, path: str, is_dir: bool):
+        self.name = name
+        self.path = path
+        self._is_dir = is_dir
+        self._stat = None
+    
+    def is_dir(self) -> bool:
+        return self._is_dir
+    
+    def is_file(self) -> bool:
+        return not self._is_dir
+    
+    def stat(self) -> os.stat_result:
+        if self._stat is None:
+            self._stat = os.stat(self.path)
+        return self._stat
+
+class ScanCache:
+    """On-disk (SQLite) cache of directory listings keyed by path, mtime and inode.
+    
+    A directory is only re-listed when its mtime or inode changed since the
+    last run. Only names and kinds are cached: file sizes are still read live,
+    because editing a file in place does not touch its directory's mtime.
+    
+    Like git's "racily clean" index entries, a listing taken within RACY_NS of
+    its directory's mtime is stored without the mtime, so it is listed again
+    next run: an entry added later in the same timestamp tick would not change
+    the mtime. Rows under child directories that disappeared are deleted.
+    """
+    
+    # Coarsest directory mtime granularity expected (FAT has 2 s)
+    RACY_NS = 2 * 10**9
+    
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        # Autocommit: an open write transaction would lock out the process-pool shards'
+        # caches until close(); in WAL mode NORMAL sync makes per-listing commits cheap
+        self._conn = sqlite3.connect(db_path, timeout=60, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS listings ("
+            "path TEXT PRIMARY KEY, mtime_ns INTEGER, inode INTEGER, entries TEXT)")
+        self.hits = 0
+        self.misses = 0
+    
+    def __enter__(self) -> 'ScanCache':
+        return self
+    
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+    
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+    
+    def list_directory(self, directory: Union[str, Path]) -> List[CachedEntry]:
+        """Return the directories and files in directory (raises OSError if it cannot be read)"""
+        directory = os.fspath(directory)
+        dir_stat = os.stat(directory)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT mtime_ns, inode, entries FROM listings WHERE path = ?", (directory,)).fetchone()
+        
+        if row is not None and row[0] == dir_stat.st_mtime_ns and row[1] == dir_stat.st_ino:
+            self.hits += 1
+            entries = json.loads(row[2])
+        else:
+            self.misses += 1
+            listed_ns = time.time_ns()
+            entries = []
+            with os.scandir(directory) as it:
+                for entry in it:
+                    is_dir = classify_entry(entry)
+                    if is_dir is not None:
+                        entries.append((entry.name, is_dir))
+            mtime_ns = dir_stat.st_mtime_ns
+            if mtime_ns > listed_ns - self.RACY_NS:
+                mtime_ns = None
+            with self._lock:
+                if row is not None:
+                    self._forget_removed(directory, json.loads(row[2]), entries)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO listings VALUES (?, ?, ?, ?)",
+                    (directory, mtime_ns, dir_stat.st_ino, json.dumps(entries)))
+        
+        return [CachedEntry(name, os.path.join(directory, name), is_dir) for name, is_dir in entries]
+    
+    def _forget_removed(self, directory: str, old_entries: List, entries: List) -> None:
+        """Delete the rows of old child directories (and everything below them) that are gone"""
+        current = {name for name, is_dir in entries if is_dir}
+        for name, is_dir in old_entries:
+            if is_dir and name not in current:
+                path = os.path.join(directory, name)
+                # Paths below path sort strictly between path + sep and path + the next character
+                self._conn.execute(
+                    "DELETE FROM listings WHERE path = ? OR (path > ? AND path < ?)",
+                    (path, path + os.sep, path + chr(ord(os.sep) + 1)))
+
+class RenderCache:
+    """Directory of rendered outputs keyed by tree hash and render options.
+    
+    Each entry is a copy of one output file, named after its key. A hit copies
+    the entry to the output path and touches it, so when the cache grows past
+    max_bytes the least recently used entries are deleted first.
+    """
+    
+    DEFAULT_SIZE = 1024 * 1024 * 1024
+    
+    def __init__(self, directory: Union[str, Path], max_bytes: int = DEFAULT_SIZE):
+        self.directory = os.fspath(directory)
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def key(parts: Dict) -> str:
+        """Cache key for a JSON-serialisable description of an output"""
+        return hashlib.sha256(json.dumps(parts, sort_keys=True).encode('utf-8')).hexdigest()
+    
+    def fetch(self, key: str, output_path: Union[str, Path]) -> bool:
+        """Copy the entry for key to output_path; False if there is none"""
+        entry = os.path.join(self.directory, key)
+        try:
+            shutil.copyfile(entry, output_path)
+            os.utime(entry)
+        except FileNotFoundError:
+            self.misses += 1
+            return False
+        self.hits += 1
+        return True
+    
+    def store(self, key: str, output_path: Union[str, Path]) -> None:
+        """Add a copy of output_path as the entry for key, then evict down to max_bytes"""
+        entry = os.path.join(self.directory, key)
+        partial = f"{entry}.{os.getpid()}.tmp"
+        shutil.copyfile(output_path, partial)
+        os.replace(partial, entry)
+        self._evict()
+    
+    def _evict(self) -> None:
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith('.tmp') or not entry.is_file():
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        
+        total = sum(size for _mtime, size, _path in entries)
+        for _mtime, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+class Inotify:
+    """Minimal ctypes binding to the Linux inotify API"""
+    
+    IN_MODIFY = 0x00000002
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF = 0x00000800
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ONLYDIR = 0x01000000
+    IN_ISDIR = 0x40000000
+    IN_CLOEXEC = 0o2000000
+    
+    WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+                  IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+    
+    _EVENT_HEADER = struct.Struct('iIII')
+    
+    def __init__(self):
+        libc_name = ctypes.util.find_library('c')
+        libc = ctypes.CDLL(libc_name, use_errno=True) if libc_name else None
+        if libc is None or not hasattr(libc, 'inotify_init1'):
+            raise OSError("Watch mode needs Linux inotify")
+        self._libc = libc
+        self.fd = libc.inotify_init1(self.IN_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        # A symlinked folder shares its target's watch, so one wd can map to several paths
+        self.paths: Dict[int, Set[str]] = {}
+        self.watches: Dict[str, int] = {}
+    
+    def __enter__(self) -> 'Inotify':
+        return self
+    
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+    
+    def close(self) -> None:
+        os.close(self.fd)
+    
+    def add_watch(self, path: str) -> int:
+        """Watch a directory and return 0, or the errno if it can't be watched
+        (ENOSPC once fs.inotify.max_user_watches is used up, EACCES...);
+        adding the same directory twice is harmless"""
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), self.WATCH_MASK)
+        if wd < 0:
+            return ctypes.get_errno()
+        self.paths.setdefault(wd, set()).add(path)
+        self.watches[path] = wd
+        return 0
+    
+    def remove_watches(self, path: str) -> None:
+        """Stop watching a directory and everything below it"""
+        below = path + os.sep
+        for watched in [p for p in self.watches if p == path or p.startswith(below)]:
+            wd = self.watches.pop(watched)
+            paths = self.paths.get(wd, set())
+            paths.discard(watched)
+            if not paths:
+                self.paths.pop(wd, None)
+                self._libc.inotify_rm_watch(self.fd, wd)
+    
+    def read_events(self, timeout: Optional[float] = None) -> List[Tuple[str, int, str]]:
+        """Wait up to timeout seconds (forever if None) and return (directory, mask, name) events"""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        
+        data = os.read(self.fd, 64 * 1024)
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _cookie, length = self._EVENT_HEADER.unpack_from(data, offset)
+            offset += self._EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            
+            if mask & self.IN_IGNORED:
+                for path in self.paths.pop(wd, ()):
+                    if self.watches.get(path) == wd:
+                        del self.watches[path]
+                continue
+            if mask & self.IN_Q_OVERFLOW:
+                events.append(('', mask, name))
+            for path in self.paths.get(wd, ()):
+                events.append((path, mask, name))
+        return events
+
+class MemoryListingCache:
+    """In-memory directory listings kept current by inotify events (used by watch mode).
+    
+    Every directory listed is also watched, so a change only drops the
+    listings (or cached stats) it affects and the next render re-lists just those.
+    A directory that can't be watched is not cached but listed again every
+    time (with a warning on the first one).
+    """
+    
+    def __init__(self, inotify: Inotify):
+        self.inotify = inotify
+        self._lock = threading.Lock()
+        self._listings: Dict[str, List[CachedEntry]] = {}
+        self.unwatched = 0
+    
+    def list_directory(self, directory: Union[str, Path]) -> List[CachedEntry]:
+        """Return the directories and files in directory (raises OSError if it cannot be read)"""
+        directory = os.fspath(directory)
+        with self._lock:
+            listing = self._listings.get(directory)
+        if listing is not None:
+            return listing
+        
+        # Watch before listing so nothing created in between is missed
+        error = self.inotify.add_watch(directory)
+        listing = []
+        with os.scandir(directory) as it:
+            for entry in it:
+                is_dir = classify_entry(entry)
+                if is_dir is not None:
+                    listing.append(CachedEntry(entry.name, entry.path, is_dir))
+        with self._lock:
+            if not error:
+                self._listings[directory] = listing
+                return listing
+            self.unwatched += 1
+            first = self.unwatched == 1
+        if first:
+            hint = " (raise fs.inotify.max_user_watches)" if error == errno.ENOSPC else ""
+            print(f"Warning: cannot watch {directory}: {os.strerror(error)}{hint}; "
+                  f"folders that can't be watched are re-listed on every update", file=sys.stderr)
+        return listing
+    
+    def apply_event(self, directory: str, mask: int, name: str) -> None:
+        """Patch the cached listings for one inotify event"""
+        if mask & Inotify.IN_Q_OVERFLOW:
+            # Events were lost, so nothing cached can be trusted
+            with self._lock:
+                self._listings.clear()
+            return
+        
+        if mask & (Inotify.IN_DELETE_SELF | Inotify.IN_MOVE_SELF):
+            self._forget(directory)
+            return
+        
+        if mask & (Inotify.IN_CREATE | Inotify.IN_DELETE | Inotify.IN_MOVED_FROM | Inotify.IN_MOVED_TO):
+            with self._lock:
+                self._listings.pop(directory, None)
+            if mask & Inotify.IN_ISDIR and mask & (Inotify.IN_DELETE | Inotify.IN_MOVED_FROM):
+                self._forget(os.path.join(directory, name))
+            return
+        
+        # Content or attribute change: only the file's cached stat is stale
+        with self._lock:
+            listing = self._listings.get(directory, [])
+        for entry in listing:
+            if entry.name == name:
+                entry._stat = None
+    
+    def _forget(self, directory: str) -> None:
+        """Drop the listings and watches of a directory that went away"""
+        below = directory + os.sep
+        with self._lock:
+            for path in [p for p in self._listings if p == directory or p.startswith(below)]:
+                del self._listings[path]
+        self.inotify.remove_watches(directory)
+
+class TreeModel:
+    """Compact, style-independent tree built once per scan.
+    
+    Nodes are stored in display (depth-first) order as parallel arrays, with
+    names interned in a single list, so an entry costs a few dozen bytes
+    instead of a fully rendered line. Renderers turn it into lines on demand.
+    Each folder also has a Merkle hash of its listing (see set_hashes), so two
+    trees can be compared without walking subtrees that are the same.
+    """
+    
+    KIND_DIR = 0
+    KIND_FILE = 1
+    KIND_MORE = 2     # "... (N more files)" marker; size holds N
+    
+    FLAG_LAST = 1     # last child of its parent (drawn with a corner)
+    FLAG_KEY = 2      # key project directory
+    
+    def __init__(self):
+        self.parent = array('i')
+        self.depth = array('H')
+        self.kind = array('B')
+        self.flags = array('B')
+        self.name_id = array('I')
+        self.size = array('q')    # -1 when unknown (folders scanned without show_size)
+        self.hash = array('Q')    # folders' Merkle hashes, 0 for files and unscanned folders
+        self.names: List[str] = []
+        self._name_ids: Dict[str, int] = {}
+        self._open_dirs: List[int] = []
+        self.show_size = False
+        self.stats = {'folders': 0, 'files': 0, 'total_size': 0, 'truncated_folders': 0}
+    
+    def __len__(self) -> int:
+        return len(self.kind)
+    
+    def add_node(self, depth: int, kind: int, name: str, size: int, flags: int) -> int:
+        """Append a node record (in depth-first order) and return its index"""
+        index = len(self.kind)
+        name_id = self._name_ids.get(name)
+        if name_id is None:
+            name_id = self._name_ids[name] = len(self.names)
+            self.names.append(name)
+        
+        self.parent.append(self._open_dirs[depth - 1] if depth > 0 else -1)
+        self.depth.append(depth)
+        self.kind.append(kind)
+        self.flags.append(flags)
+        self.name_id.append(name_id)
+        self.size.append(size)
+        self.hash.append(0)
+        if kind == self.KIND_DIR:
+            del self._open_dirs[depth:]
+            self._open_dirs.append(index)
+        return index
+    
+    def node(self, index: int) -> Node:
+        """Return node index as a (depth, kind, name, size, flags) record"""
+        return (self.depth[index], self.kind[index], self.names[self.name_id[index]],
+                self.size[index], self.flags[index])
+    
+    def iter_nodes(self, start: int = 0) -> Iterator[Node]:
+        """Yield the node records in display order, from node start onwards"""
+        names = self.names
+        columns = (self.depth, self.kind, self.name_id, self.size, self.flags)
+        if start:
+            columns = [itertools.islice(column, start, None) for column in columns]
+        depth, kind, name_id, size, flags = columns
+        return zip(depth, kind, (names[i] for i in name_id), size, flags)
+    
+    def set_hashes(self, digests: Iterable[int]) -> None:
+        """Store the folders' hashes, given in the order the walk finishes them (post-order)"""
+        digests = iter(digests)
+        open_dirs = []
+        for index, (depth, kind) in enumerate(zip(self.depth, self.kind)):
+            while open_dirs and self.depth[open_dirs[-1]] >= depth:
+                self.hash[open_dirs.pop()] = next(digests)
+            if kind == self.KIND_DIR:
+                open_dirs.append(index)
+        for index in reversed(open_dirs):
+            self.hash[index] = next(digests)
+    
+    @property
+    def tree_hash(self) -> int:
+        """The root folder's hash: equal for two scans that found the same tree"""
+        return self.hash[0] if len(self) else 0
+    
+    def memory_usage(self) -> int:
+        """Approximate bytes held by the model (arrays plus interned names)"""
+        arrays = (self.parent, self.depth, self.kind, self.flags, self.name_id, self.size, self.hash)
+        total = sum(a.itemsize * len(a) for a in arrays)
+        total += sys.getsizeof(self.names) + sys.getsizeof(self._name_ids)
+        total += sum(sys.getsizeof(name) for name in self.names)
+        return total
+    
+    def bytes_per_entry(self) -> float:
+        """Memory per node, for benchmarks"""
+        return self.memory_usage() / len(self) if len(self) else 0.0
+
+class TreeLines(Sequence):
+    """Read-only list of tree lines rendered on demand from a TreeModel"""
+    
+    def __init__(self, generator: 'FolderTreeGenerator', model: TreeModel):
+        self.generator = generator
+        self.model = model
+    
+    def __len__(self) -> int:
+        return len(self.model)
+    
+    def __iter__(self) -> Iterator[str]:
+        return self.generator._render_nodes(self.model.iter_nodes(), self.model.show_size)
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("tree line index out of range")
+        
+        # Rebuild the prefix from the ancestors' "last child" flags
+        model = self.model
+        style = self.generator.style
+        parts = []
+        ancestor = model.parent[index]
+        while ancestor > 0:
+            parts.append(style['space'] if model.flags[ancestor] & TreeModel.FLAG_LAST else style['vertical'])
+            ancestor = model.parent[ancestor]
+        prefix = ''.join(reversed(parts))
+        return self.generator._format_node(prefix, model.node(index), model.show_size)
+
+class TreeSnapshot:
+    """A TreeModel saved to disk, memory-mapped for re-rendering without a walk.
+    
+    Layout: a fixed header (magic, counts, stats), JSON metadata, then fixed-width
+    columns (size, hash, parent, depth, kind, flags) and the names, front-coded against
+    the previous name with a full name every NAMES_BLOCK entries. Loading maps the
+    file and reads the columns in place, so no Python object is built per entry;
+    the snapshot has the same interface as TreeModel for TreeLines and renderers.
+    """
+    
+    MAGIC = b'FTSNAP\r\n'
+    VERSION = 2
+    NAMES_BLOCK = 16
+    
+    # magic, version, flags, names block, count, folders, files, total_size,
+    # truncated_folders, metadata length, names length
+    HEADER = struct.Struct('<8sHHIQqqqqQQ')
+    FLAG_SHOW_SIZE = 1
+    FLAG_BIG_ENDIAN = 2
+    
+    # Column typecodes, widest first so every column stays aligned
+    COLUMNS = (('size', 'q'), ('hash', 'Q'), ('parent', 'i'), ('depth', 'H'), ('kind', 'B'), ('flags', 'B'))
+    
+    def __init__(self, path: Union[str, Path]):
+        self.path = os.fspath(path)
+        with open(self.path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        
+        try:
+            (magic, version, flags, self._block, count, folders, files, total_size, truncated,
+             meta_length, names_length) = self.HEADER.unpack_from(self._mmap, 0)
+            if magic != self.MAGIC:
+                raise ValueError(f"Not a folder tree snapshot: {self.path}")
+            if version != self.VERSION:
+                raise ValueError(f"Snapshot format version {version} is not supported "
+                                 f"(expected {self.VERSION}); re-create it from a scan: {self.path}")
+            if bool(flags & self.FLAG_BIG_ENDIAN) != (sys.byteorder == 'big'):
+                raise ValueError(f"Snapshot was written on a machine of the other byte order: {self.path}")
+        except (ValueError, struct.error):
+            self._mmap.close()
+            raise
+        
+        self._count = count
+        self.show_size = bool(flags & self.FLAG_SHOW_SIZE)
+        self.stats = {'folders': folders, 'files': files, 'total_size': total_size,
+                      'truncated_folders': truncated}
+        
+        offset = self.HEADER.size
+        self.meta = json.loads(self._mmap[offset:offset + meta_length].decode('utf-8'))
+        offset = self._align(offset + meta_length)
+        
+        view = memoryview(self._mmap)
+        self._views = [view]
+        for name, typecode in self.COLUMNS:
+            width = array(typecode).itemsize
+            column = view[offset:offset + width * count].cast(typecode)
+            self._views.append(column)
+            setattr(self, name, column)
+            offset += width * count
+        offset = self._align(offset)
+        
+        blocks = -(-count // self._block)
+        self._block_offsets = view[offset:offset + 8 * blocks].cast('Q')
+        self._views.append(self._block_offsets)
+        self._names_start = offset + 8 * blocks
+        self._names_end = self._names_start + names_length
+    
+    @staticmethod
+    def _align(offset: int) -> int:
+        return (offset + 7) & ~7
+    
+    @classmethod
+    def is_snapshot(cls, path: Union[str, Path]) -> bool:
+        """Whether path is a snapshot file (checked by its magic bytes)"""
+        try:
+            with open(path, 'rb') as f:
+                return f.read(len(cls.MAGIC)) == cls.MAGIC
+        except OSError:
+            return False
+    
+    @classmethod
+    def write(cls, path: Union[str, Path], model, root_path: str = "") -> None:
+        """Write a TreeModel (or another snapshot) to path"""
+        count = len(model)
+        names = bytearray()
+        block_offsets = array('Q')
+        previous = b''
+        for i, (_depth, _kind, name, _size, _flags) in enumerate(model.iter_nodes()):
+            encoded = name.encode('utf-8', 'surrogateescape')
+            if i % cls.NAMES_BLOCK == 0:
+                block_offsets.append(len(names))
+                shared = 0
+            else:
+                limit = min(len(previous), len(encoded))
+                shared = 0
+                while shared < limit and previous[shared] == encoded[shared]:
+                    shared += 1
+            names += _varint(shared) + _varint(len(encoded) - shared) + encoded[shared:]
+            previous = encoded
+        
+        meta = json.dumps({'root': os.fspath(Path(root_path).resolve()) if root_path else None,
+                           'generated': datetime.now().strftime('%Y-%m-%d %H:%M:%S')}).encode('utf-8')
+        flags = (cls.FLAG_SHOW_SIZE if model.show_size else 0) | (cls.FLAG_BIG_ENDIAN if sys.byteorder == 'big' else 0)
+        stats = model.stats
+        
+        with open(path, 'wb') as f:
+            f.write(cls.HEADER.pack(cls.MAGIC, cls.VERSION, flags, cls.NAMES_BLOCK, count,
+                                    stats['folders'], stats['files'], stats['total_size'],
+                                    stats['truncated_folders'], len(meta), len(names)))
+            f.write(meta)
+            f.write(b'\0' * (cls._align(f.tell()) - f.tell()))
+            for name, typecode in cls.COLUMNS:
+                column = getattr(model, name)
+                f.write(column if isinstance(column, memoryview) else array(typecode, column))
+            f.write(b'\0' * (cls._align(f.tell()) - f.tell()))
+            f.write(block_offsets)
+            f.write(names)
+    
+    def __len__(self) -> int:
+        return self._count
+    
+    def __reduce__(self):
+        # Process-pool workers reopen the file rather than receive the mapping
+        return (TreeSnapshot, (self.path,))
+    
+    def __enter__(self) -> 'TreeSnapshot':
+        return self
+    
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+    
+    def close(self) -> None:
+        """Release the column views and unmap the file"""
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        self._mmap.close()
+    
+    def _iter_names(self, start: int = 0) -> Iterator[str]:
+        """Decode names from entry start (rounded down to its block) onwards"""
+        data = self._mmap
+        block = start // self._block
+        pos = self._names_start + self._block_offsets[block] if self._count else self._names_end
+        end = self._names_end
+        previous = b''
+        index = block * self._block
+        while pos < end:
+            # Both lengths nearly always fit in one byte
+            shared = data[pos]
+            if shared < 0x80:
+                pos += 1
+            else:
+                shared, pos = _read_varint(data, pos)
+            length = data[pos]
+            if length < 0x80:
+                pos += 1
+            else:
+                length, pos = _read_varint(data, pos)
+            current = previous[:shared] + data[pos:pos + length]
+            pos += length
+            if index >= start:
+                yield current.decode('utf-8', 'surrogateescape')
+            previous = current
+            index += 1
+    
+    def node(self, index: int) -> Node:
+        """Return node index as a (depth, kind, name, size, flags) record"""
+        names = self._iter_names(index)
+        return (self.depth[index], self.kind[index], next(names), self.size[index], self.flags[index])
+    
+    def iter_nodes(self, start: int = 0) -> Iterator[Node]:
+        """Yield the node records in display order, from node start onwards"""
+        if not start:
+            return zip(self.depth, self.kind, self._iter_names(), self.size, self.flags)
+        return zip(self.depth[start:], self.kind[start:], self._iter_names(start),
+                   self.size[start:], self.flags[start:])
+    
+    @property
+    def tree_hash(self) -> int:
+        """The root folder's hash, as for TreeModel"""
+        return self.hash[0] if self._count else 0
+    
+    def memory_usage(self) -> int:
+        """Bytes mapped for the snapshot (pages are only read in as they are touched)"""
+        return len(self._mmap)
+    
+    def bytes_per_entry(self) -> float:
+        """Snapshot bytes per node, for benchmarks"""
+        return self.memory_usage() / len(self) if len(self) else 0.0
+
+class _DiffCursor:
+    """Walks one tree for TreeDiff, with each entry's path and sort key.
+    
+    Entries come in display order, which is the order of their keys: a key is
+    the list of (is file, lower-case name, name) for each path component, so
+    folders sort before files at every level, as in the walk. The key list is
+    updated in place and paths are only joined when asked for.
+    """
+    
+    def __init__(self, model):
+        self._model = model
+        self._keys: List[Tuple[bool, str, str]] = []
+        self._seek(1)    # the roots are compared as totals, not entries
+        self.advance()
+    
+    def _seek(self, index: int) -> None:
+        self._index = index - 1
+        self._nodes = self._model.iter_nodes(index)
+    
+    def advance(self) -> None:
+        """Move to the next folder or file (truncation markers are skipped)"""
+        keys = self._keys
+        kind_dir, kind_more = TreeModel.KIND_DIR, TreeModel.KIND_MORE
+        for depth, kind, name, size, _flags in self._nodes:
+            self._index += 1
+            if kind == kind_more:
+                continue
+            del keys[depth - 1:]
+            keys.append((kind != kind_dir, name.lower(), name))
+            self.key = keys
+            self.depth, self.kind, self.size = depth, kind, size
+            return
+        self.key = None
+    
+    @property
+    def name(self) -> str:
+        return self._keys[-1][2]
+    
+    @property
+    def hash(self) -> int:
+        return self._model.hash[self._index]
+    
+    def skip_same(self) -> None:
+        """Move past the current folder's subtree without reading it (its hash matched)"""
+        depths = self._model.depth
+        top_depth, end, count = self.depth, self._index + 1, len(self._model)
+        while end < count and depths[end] > top_depth:
+            end += 1
+        self._seek(end)
+        self.advance()
+    
+    @property
+    def path(self) -> str:
+        return '/'.join(component[2] for component in self._keys)
+    
+    def skip_subtree(self) -> List[Dict]:
+        """Move past the current entry and everything below it.
+        
+        Returns a unit per entry of the subtree in display order (the entry itself
+        first), each with path, kind, name, size and, counting itself, entries.
+        Folder sizes unknown to the scan are summed from the files below them.
+        """
+        top_depth = self.depth
+        units, open_units = [], []
+        while self.key is not None and (not units or self.depth > top_depth):
+            while open_units and open_units[-1]['depth'] >= self.depth:
+                self._close(open_units.pop())
+            is_file = self.kind == TreeModel.KIND_FILE
+            unit = {'path': self.path, 'kind': 'file' if is_file else 'dir', 'name': self.name,
+                    'size': self.size, 'entries': 1, 'depth': self.depth, 'bytes': 0}
+            for ancestor in open_units:
+                ancestor['entries'] += 1
+                if is_file:
+                    ancestor['bytes'] += self.size
+            units.append(unit)
+            if is_file:
+                del unit['depth'], unit['bytes']
+            else:
+                open_units.append(unit)
+            self.advance()
+        for unit in open_units:
+            self._close(unit)
+        return units
+    
+    @staticmethod
+    def _close(unit: Dict) -> None:
+        if unit['size'] < 0:
+            unit['size'] = unit['bytes']
+        del unit['depth'], unit['bytes']
+
+class TreeDiff:
+    """Changes between two trees (TreeModel or TreeSnapshot), found in one merge walk.
+    
+    Both trees are walked side by side in display order: an entry on one side only
+    is added or removed along with its whole subtree, which is reported once; a
+    file on both sides with another size is resized. A folder whose Merkle hash
+    is the same on both sides is skipped unread, so the walk costs about as much
+    as the changes, not the trees. Entries of removed and added
+    subtrees with the same (kind, name, size, entries) are then paired up as moves,
+    outermost first, and taken out of the added and removed counts.
+    Each change is a dict with change, path, kind, size and, for folders, entries.
+    """
+    
+    CHANGES = ('added', 'removed', 'resized', 'moved')
+    
+    def __init__(self, old, new):
+        self.old_stats = dict(old.stats)
+        self.new_stats = dict(new.stats)
+        self.changes: List[Dict] = []
+        self._units = {'added': [], 'removed': []}
+        
+        if old.tree_hash and old.tree_hash == new.tree_hash:
+            return
+        
+        a, b = _DiffCursor(old), _DiffCursor(new)
+        while a.key is not None or b.key is not None:
+            if b.key is None or (a.key is not None and a.key < b.key):
+                self._one_side('removed', a)
+            elif a.key is None or b.key < a.key:
+                self._one_side('added', b)
+            elif a.kind == TreeModel.KIND_DIR and a.hash and a.hash == b.hash:
+                a.skip_same()
+                b.skip_same()
+            else:
+                if a.kind == TreeModel.KIND_FILE and a.size != b.size:
+                    self.changes.append({'change': 'resized', 'path': b.path, 'kind': 'file',
+                                         'old_size': a.size, 'new_size': b.size})
+                a.advance()
+                b.advance()
+        
+        self._reconcile()
+    
+    def _one_side(self, change: str, cursor: _DiffCursor) -> None:
+        units = cursor.skip_subtree()
+        top = dict(units[0], change=change)
+        self.changes.append(top)
+        for unit in units:
+            unit['top'] = top
+        self._units[change].extend(units)
+    
+    @staticmethod
+    def _under(path: str, roots: Set[str]) -> bool:
+        """Whether path or one of its ancestors is in roots"""
+        while path not in roots:
+            cut = path.rfind('/')
+            if cut < 0:
+                return False
+            path = path[:cut]
+        return True
+    
+    def _reconcile(self) -> None:
+        """Pair up removed and added entries: the same path (siblings whose names tie
+        case-insensitively can sort either way), then moves"""
+        dropped = set()
+        removed = {(r['kind'], r['path']): r for r in self.changes if r['change'] == 'removed'}
+        for record in [r for r in self.changes if r['change'] == 'added']:
+            other = removed.pop((record['kind'], record['path']), None)
+            if other is not None:
+                dropped.update((id(other), id(record)))
+                if (other['size'], other['entries']) != (record['size'], record['entries']):
+                    self.changes.append({'change': 'resized', 'path': record['path'], 'kind': record['kind'],
+                                         'old_size': other['size'], 'new_size': record['size']})
+        
+        sources = {}
+        for unit in reversed(self._units['removed']):
+            if id(unit['top']) not in dropped:
+                sources.setdefault((unit['kind'], unit['name'], unit['size'], unit['entries']), []).append(unit)
+        moved_from, moved_to = set(), set()
+        for unit in self._units['added']:
+            if id(unit['top']) in dropped or self._under(unit['path'], moved_to):
+                continue
+            candidates = sources.get((unit['kind'], unit['name'], unit['size'], unit['entries']))
+            source = None
+            while candidates and source is None:
+                candidate = candidates.pop()
+                if not self._under(candidate['path'], moved_from):
+                    source = candidate
+            if source is None:
+                continue
+            
+            moved_to.add(unit['path'])
+            moved_from.add(source['path'])
+            self.changes.append({'change': 'moved', 'path': unit['path'], 'from': source['path'],
+                                 'kind': unit['kind'], 'size': unit['size'], 'entries': unit['entries']})
+            for side in (unit, source):
+                side['top']['entries'] -= side['entries']
+                side['top']['size'] -= side['size']
+        
+        self.changes = [r for r in self.changes if id(r) not in dropped and r.get('entries', 1) > 0]
+        self.changes.sort(key=lambda r: r['path'].lower())
+        for record in self.changes:
+            record.pop('name', None)
+            if record['kind'] == 'file':
+                record.pop('entries', None)
+        self._units = {'added': [], 'removed': []}
+    
+    def summary(self) -> Dict[str, int]:
+        """Number of changes of each kind"""
+        counts = dict.fromkeys(self.CHANGES, 0)
+        for record in self.changes:
+            counts[record['change']] += 1
+        return counts
+    
+    def iter_lines(self, format_size) -> Iterator[str]:
+        """Annotated text: + added, - removed, ~ resized, > moved, then a summary"""
+        for record in self.changes:
+            change, path = record['change'], record['path']
+            if record['kind'] == 'dir':
+                path += '/'
+                entries = record.get('entries', 0)
+                detail = f"{entries} {'entry' if entries == 1 else 'entries'}, {format_size(record['size'])}" if entries else ''
+            else:
+                detail = format_size(record['size']) if 'size' in record else ''
+            
+            if change == 'resized':
+                yield f"~ {path} ({format_size(record['old_size'])} -> {format_size(record['new_size'])})"
+            elif change == 'moved':
+                yield f"> {record['from']}{'/' if record['kind'] == 'dir' else ''} -> {path} ({detail})"
+            else:
+                yield f"{'+' if change == 'added' else '-'} {path} ({detail})"
+        
+        counts = self.summary()
+        yield ""
+        yield "Summary: " + ", ".join(f"{counts[change]} {change}" for change in self.CHANGES)
+        yield (f"Total size: {format_size(self.old_stats['total_size'])} -> {format_size(self.new_stats['total_size'])}")
+    
+    def to_json(self) -> Dict:
+        """The changes and summary as a JSON-ready dict"""
+        return {'summary': self.summary(), 'old_stats': self.old_stats, 'new_stats': self.new_stats,
+                'changes': self.changes}
+
+def _varint(value: int) -> bytes:
+    """Encode a non-negative int as a LEB128 varint"""
+    out = bytearray()
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+def _read_varint(data, pos: int) -> Tuple[int, int]:
+    """Decode a LEB128 varint at pos and return (value, next position)"""
+    byte = data[pos]
+    if byte < 0x80:
+        return byte, pos + 1
+    value, shift = 0, 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+def tree_line_segments(style: Dict[str, str]) -> List[str]:
+    """Prefix pieces of a tree style, longest first so a connector wins over the vertical and space pieces"""
+    return sorted({style['junction'], style['corner'], style['vertical'], style['space']},
+                  key=len, reverse=True)
+
+def split_tree_line(line: str, segments: List[str]) -> Tuple[List[str], str]:
+    """Split a tree line into its prefix pieces and icon, and the remaining text"""
+    pieces = []
+    pos = 0
+    while True:
+        for segment in segments:
+            if line.startswith(segment, pos):
+                pieces.append(segment)
+                pos += len(segment)
+                break
+        else:
+            break
+    
+    # The icon runs up to the space before the name
+    end = line.find(' ', pos)
+    if end > pos:
+        pieces.append(line[pos:end])
+        pos = end
+    return pieces, line[pos:]
+
+class GlyphCache:
+    """Rasterized tree prefix pieces and icons for PNG rendering.
+    
+    The prefix pieces (│, ├─, └─) and icons repeat on nearly every line, so each
+    distinct one is drawn through the font once into a mask and pasted after that;
+    only the name part of a line still goes through the font renderer.
+    """
+    
+    def __init__(self, font, style: Dict[str, str], mask_mode: str = 'L'):
+        self.font = font
+        # '1' pages need 1-bit masks; 'L' masks would blend grey into them
+        self.mask_mode = mask_mode
+        self.segments = tree_line_segments(style)
+        self.sprites = {}   # text -> (mask, x offset, advance)
+    
+    def sprite(self, text: str):
+        """Mask, x offset and advance width for a piece of text, drawn on first use"""
+        cached = self.sprites.get(text)
+        if cached is None:
+            left, _top, right, bottom = self.font.getbbox(text)
+            left = min(0, math.floor(left))
+            mask = Image.new(self.mask_mode, (max(1, math.ceil(right) - left), max(1, math.ceil(bottom))), 0)
+            ImageDraw.Draw(mask).text((-left, 0), text, fill=255, font=self.font)
+            cached = self.sprites[text] = (mask, left, self.font.getlength(text))
+        return cached
+    
+    def draw_line(self, draw, xy: Tuple[int, int], line: str, fill) -> None:
+        """Draw one tree line, pasting the cached pieces and rendering the rest"""
+        x, y = xy
+        pieces, text = split_tree_line(line, self.segments)
+        for piece in pieces:
+            mask, offset, advance = self.sprite(piece)
+            draw.bitmap((round(x) + offset, y), mask, fill=fill)
+            x += advance
+        if text:
+            draw.text((x, y), text, fill=fill, font=self.font)
+
+# Symbol fonts of the process, keyed by (path, raster size); None where a font didn't load
+_symbol_fonts: Dict[Tuple[str, int], object] = {}
+
+class PdfGlyphForms:
+    """Tree prefix pieces and icons for PDF output, as reusable form XObjects.
+    
+    The PDF's Helvetica only covers WinAnsi characters, so box-drawing prefixes
+    and emoji icons would be lost. Each distinct piece outside it is rasterized
+    once with PIL, from the first symbol font that has its glyphs, and registered
+    as a form that every line refers to; the file grows with the number of
+    distinct pieces, not with the line count. Pieces no font covers stay text.
+    """
+    
+    SYMBOL_FONTS = (
+        'seguiemj.ttf', 'seguisym.ttf',
+        '/System/Library/Fonts/Apple Color Emoji.ttc',
+        '/System/Library/Fonts/Apple Symbols.ttf',
+        '/usr/share/fonts/truetype/noto/NotoColorEmoji.ttf',
+        '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
+    )
+    
+    # Raster pixels per point of text size
+    SCALE = 4
+    
+    def __init__(self, c, style: Dict[str, str], font_name: str, font_size: float,
+                 symbol_font: Optional[str] = None):
+        self.canvas = c
+        self.segments = tree_line_segments(style)
+        self.font_name = font_name
+        self.font_size = font_size
+        self.fonts = []
+        if PIL_AVAILABLE:
+            for path in ((symbol_font,) if symbol_font else ()) + self.SYMBOL_FONTS:
+                key = (path, round(font_size * self.SCALE))
+                if key not in _symbol_fonts:
+                    _symbol_fonts[key] = self._load_font(path)
+                if _symbol_fonts[key] is not None:
+                    self.fonts.append(_symbol_fonts[key])
+        self.forms = {}     # piece -> (form name, width, descent), or None to draw it as text
+        self._notdef = {}   # font -> raster of a character it has no glyph for
+    
+    def _load_font(self, path: str):
+        """Load a symbol font at raster size; colour emoji fonts only come in fixed sizes.
+        
+        Other sizes are only tried for a font file that exists: a missing one (or a
+        bare name PIL's font folder search can't find) fails the same way at every size.
+        """
+        for size in (round(self.font_size * self.SCALE), 109, 160, 96, 64):
+            try:
+                return ImageFont.truetype(path, size)
+            except OSError:
+                if not os.path.isfile(path):
+                    return None
+        return None
+    
+    def _raster(self, font, char: str) -> bytes:
+        img = Image.new('RGBA', (font.size * 2, font.size * 2))
+        ImageDraw.Draw(img).text((0, 0), char, fill='black', font=font, embedded_color=True)
+        return img.tobytes()
+    
+    def _covers(self, font, piece: str) -> bool:
+        """Whether font has a glyph for every character of piece (missing ones draw as .notdef)"""
+        if font not in self._notdef:
+            self._notdef[font] = self._raster(font, '\U0010fffd')
+        return all(self._raster(font, char) != self._notdef[font] for char in piece if not char.isspace())
+    
+    def form(self, piece: str) -> Optional[Tuple[str, float, float]]:
+        """(form name, width, descent) of a piece Helvetica can't show, or None to draw it as text"""
+        if piece in self.forms:
+            return self.forms[piece]
+        
+        result = None
+        try:
+            piece.encode('cp1252')
+        except UnicodeEncodeError:
+            font = next((f for f in self.fonts if self._covers(f, piece)), None)
+            if font is not None:
+                ascent, descent = font.getmetrics()
+                img = Image.new('RGBA', (max(1, math.ceil(font.getlength(piece))), ascent + descent))
+                ImageDraw.Draw(img).text((0, 0), piece, fill='black', font=font, embedded_color=True)
+                
+                scale = self.font_size / font.size
+                name = f"glyph{len(self.forms)}"
+                width, height = img.width * scale, img.height * scale
+                self.canvas.beginForm(name, 0, 0, width, height)
+                self.canvas.drawImage(ImageReader(img), 0, 0, width, height, mask='auto')
+                self.canvas.endForm()
+                result = (name, width, descent * scale)
+        self.forms[piece] = result
+        return result
+    
+    def add_lines(self, text, lines: Iterable[str], x: float, y: float,
+                  leading: float) -> List[Tuple[str, float, float]]:
+        """Lay lines out from (x, y) down: text runs into the text object, pieces as forms.
+        
+        Returns the (form name, x, y) placements to draw once the text object is.
+        """
+        placements = []
+        for line in lines:
+            pieces, rest = split_tree_line(line, self.segments)
+            run_x, run = x, ''
+            for piece in pieces:
+                form = self.form(piece)
+                if form is None:
+                    run += piece
+                    continue
+                
+                name, width, descent = form
+                piece_x = run_x
+                if run:
+                    text.setTextOrigin(run_x, y)
+                    text.textOut(run)
+                    piece_x = text.getX()
+                placements.append((name, piece_x, y - descent))
+                run_x, run = piece_x + width, ''
+            run += rest
+            if run:
+                text.setTextOrigin(run_x, y)
+                text.textOut(run)
+            y -= leading
+        return placements
+    
+    def place(self, placements: Iterable[Tuple[str, float, float]]) -> None:
+        """Draw the forms laid out by add_lines"""
+        c = self.canvas
+        for name, x, y in placements:
+            c.saveState()
+            c.translate(x, y)
+            c.doForm(name)
+            c.restoreState()
+
+# Fonts and glyph caches of the process, keyed by (style, font_size, mode)
+_png_fonts: Dict[Tuple, Tuple[object, GlyphCache]] = {}
+
+def _render_png_band(style: Dict[str, str], header: List[str], lines: Iterable[str],
+                     size: Tuple[int, int], y_offset: int, font_size: int, mode: str,
+                     output_path: Optional[str] = None, compress_level: int = 6):
+    """Draw one band or page of a PNG: header lines from the top margin, then tree lines from y_offset.
+    
+    Used inline or as a process-pool worker. Saves the image to output_path and
+    returns the path if given, otherwise returns the image.
+    """
+    generator = FolderTreeGenerator()
+    generator.style = style
+    key = (tuple(sorted(style.items())), font_size, mode)
+    if key not in _png_fonts:
+        font = generator._load_font(font_size)
+        _png_fonts[key] = (font, GlyphCache(font, style, mask_mode='1' if mode == '1' else 'L'))
+    font, glyphs = _png_fonts[key]
+    
+    line_height = font_size + 4
+    img, draw, ink = generator._new_png_image(size, mode)
+    generator._draw_png_lines(draw, header, 20, line_height, font, fill=ink)
+    generator._draw_png_lines(draw, lines, y_offset, line_height, font, glyphs, ink)
+    if output_path is None:
+        return img
+    img.save(output_path, compress_level=compress_level)
+    return output_path
+
+def _scan_shard(options: Dict, directory: str, depth: int, show_size: bool, show_hidden: bool,
+                sort_dirs_first: bool, include_categories: Optional[Set[str]],
+                exclude_patterns: Optional[PatternMatcher]) -> Tuple[List[Node], Dict, Tuple[Optional[int], int], array]:
+    """Process-pool worker: build one subtree and return (node records, stats, (size, hash), folder hashes)"""
+    generator = FolderTreeGenerator(max_depth=options['max_depth'],
+                                    max_files_per_folder=options['max_files_per_folder'],
+                                    workers=options['workers'],
+                                    respect_gitignore=options['respect_gitignore'],
+                                    file_order=options['file_order'])
+    generator._scan_root = options['scan_root']
+    generator._digests = array('Q')
+    nodes = []
+    with ExitStack() as stack:
+        if options['cache_path']:
+            generator._cache = stack.enter_context(ScanCache(options['cache_path']))
+        if generator.workers and generator.workers > 1:
+            generator._executor = stack.enter_context(ThreadPoolExecutor(max_workers=generator.workers))
+        result = _collect(generator._build_tree(directory, depth, show_size, show_hidden, sort_dirs_first,
+                                                include_categories, exclude_patterns), nodes)
+    return nodes, generator.stats, result, generator._digests
+
+def _render_format(generator: 'FolderTreeGenerator', fmt: str, output_path: str,
+                   options: Dict) -> List[str]:
+    """Process-pool worker for save_formats: write one format and return the paths written"""
+    return generator._save_format(fmt, output_path, options)
+
 class FolderTreeGenerator:
     """Professional folder tree generator with multiple output formats"""
     
-    def __init__(self, style='simple', icon_set='simple', max_depth=3, max_files_per_folder=None):
+    # Key project directories (matched case-insensitively)
+    KEY_DIRECTORIES = frozenset({
+        'src', 'source', 'lib', 'libs', 'app', 'apps', 'components', 
+        'pages', 'views', 'models', 'controllers', 'services', 'utils',
+        'helpers', 'config', 'configs', 'settings', 'static', 'assets',
+        'resources', 'public', 'private', 'data', 'database', 'db',
+        'migrations', 'schemas', 'api', 'apis', 'routes', 'middleware',
+        'templates', 'layouts', 'partials', 'includes',
+        'tests', 'test', 'spec', 'specs', 'docs', 'documentation',
+        'examples', 'samples', 'demos', 'tutorials', 'guides',
+        'scripts', 'tools', 'bin', 'build', 'dist', 'output',
+        'notebooks', 'helpfiles'
+    })
+    
+    def __init__(self, style='simple', icon_set='simple', max_depth=3, max_files_per_folder=None,
+                 workers=1, processes=1, cache_path=None, respect_gitignore=False, file_order='name',
+                 render_cache=None, render_cache_size=RenderCache.DEFAULT_SIZE):
         self.style = TreeStyle.STYLES.get(style, TreeStyle.STYLES['simple'])
         self.icon_set = getattr(FileTypeIcons, icon_set.upper(), FileTypeIcons.SIMPLE)
         self.max_depth = max_depth
         self.max_files_per_folder = max_files_per_folder
+        self.workers = workers
+        self.processes = processes
+        self.cache_path = cache_path
+        self.respect_gitignore = respect_gitignore
+        self.file_order = file_order
+        self.render_cache = RenderCache(render_cache, render_cache_size) if render_cache else None
         self.tree_lines = []
+        self.model: Optional[TreeModel] = None
         self.stats = {'folders': 0, 'files': 0, 'total_size': 0, 'truncated_folders': 0}
         
+        # Parallel walker state (only used while generate_tree runs with workers/processes > 1)
+        self._executor = None
+        self._prefetched: Dict[str, Future] = {}
+        self._process_pool = None
+        self._shards: Dict[str, Future] = {}
+        self._cache = None
+        
+        # Full paths left out of the scan (watch() sets it for the outputs it rewrites)
+        self._skip_path: Optional[Callable[[str], bool]] = None
+        
+        # Folder hashes in the order the walk finishes them, while generate_tree builds a model
+        self._digests: Optional[array] = None
+        
+        # .gitignore/.treeignore rules per directory, rebuilt on every scan
+        self._scan_root = ''
+        self._ignore_rules_cache: Dict[str, Tuple[GitIgnore, ...]] = {}
+        
         # File type categories for filtering
         self.file_categories = {
             'documents': {'.txt', '.md', '.pdf', '.doc', '.docx', '.rtf', '.odt'},
@@ -153,34 +1564,74 @@ class FolderTreeGenerator:
             'audio': {'.mp3', '.wav', '.flac', '.aac', '.ogg', '.m4a', '.wma'},
             'video': {'.mp4', '.avi', '.mkv', '.mov', '.wmv', '.flv', '.webm', '.m4v'},
             'code': {'.py', '.js', '.html', '.css', '.php', '.java', '.cpp', '.c', '.cs', '.rb'},
-            'archives': {'.zip', '.rar', '.7z', '.tar', '.gz', '.bz2', '.xz'},
+            'archives': {'.zip', '.rar', '.7z', '.tar', '.gz', '.bz2', '.xz', '.tar.gz', '.tar.bz2', '.tar.xz'},
         }
+        self._classification_for = None
+    
+    # State that only lives while a scan or watch() runs; none of it can be pickled
+    _SCAN_STATE = ('_executor', '_prefetched', '_process_pool', '_shards', '_cache', '_skip_path', '_digests')
+    
+    def __getstate__(self) -> Dict:
+        """Pickle the settings and the scanned tree, not the scan-time state (for renderer processes)"""
+        state = self.__dict__.copy()
+        for name in self._SCAN_STATE:
+            state[name] = {} if name in ('_prefetched', '_shards') else None
+        return state
     
-    def get_file_icon(self, file_path: Path, is_key_folder: bool = False) -> str:
-        """Get icon for file based on extension"""
-        if file_path.is_dir():
+    def get_file_icon(self, file_path: Path, is_key_folder: bool = False,
+                      is_dir: Optional[bool] = None) -> str:
+        """Get icon for file based on extension (pass is_dir to skip the stat)"""
+        if is_dir is None:
+            is_dir = file_path.is_dir()
+        return self._icon_for(file_path.name, is_dir, is_key_folder)
+    
+    def _icon_for(self, name: str, is_dir: bool, is_key_folder: bool = False) -> str:
+        """Icon for an already classified entry name"""
+        if is_dir:
             if is_key_folder:
                 return self.icon_set.get('key_folder', '📂')
             return self.icon_set.get('folder', '📁')
+        return self.classify_file(name)[0]
+    
+    def _build_classification(self) -> None:
+        """Build the extension -> (icon, category) table for the current icon set and categories"""
+        default_icon = self.icon_set.get('file', '📄')
+        categories = {}
+        for category, extensions in self.file_categories.items():
+            for ext in extensions:
+                categories.setdefault(ext, category)
+        
+        table = {ext: (default_icon, category) for ext, category in categories.items()}
+        for ext, icon in self.icon_set.items():
+            if ext.startswith('.'):
+                table[ext] = (icon, categories.get(ext))
         
-        ext = file_path.suffix.lower()
-        return self.icon_set.get(ext, self.icon_set.get('file', '📄'))
+        self._classification = table
+        self._default_classification = (default_icon, None)
+        self._classification_for = self.icon_set
+    
+    def classify_file(self, name: str) -> Tuple[str, Optional[str]]:
+        """Return (icon, category) for a file name in O(1), trying compound extensions like .tar.gz first"""
+        if self._classification_for is not self.icon_set:
+            self._build_classification()
+        
+        i = name.rfind('.')
+        if 0 < i < len(name) - 1:
+            table = self._classification
+            lower = name.lower()
+            j = lower.rfind('.', 0, i)
+            if j > 0:
+                hit = table.get(lower[j:])
+                if hit is not None:
+                    return hit
+            hit = table.get(lower[i:])
+            if hit is not None:
+                return hit
+        return self._default_classification
     
     def is_key_directory(self, dir_name: str) -> bool:
         """Determine if directory is a key project directory"""
-        key_dirs = {
-            'src', 'source', 'lib', 'libs', 'app', 'apps', 'components', 
-            'pages', 'views', 'models', 'controllers', 'services', 'utils',
-            'helpers', 'config', 'configs', 'settings', 'static', 'assets',
-            'resources', 'public', 'private', 'data', 'database', 'db',
-            'migrations', 'schemas', 'api', 'apis', 'routes', 'middleware',
-            'templates', 'views', 'layouts', 'partials', 'includes',
-            'tests', 'test', 'spec', 'specs', 'docs', 'documentation',
-            'examples', 'samples', 'demos', 'tutorials', 'guides',
-            'scripts', 'tools', 'bin', 'build', 'dist', 'output',
-            'notebooks', 'helpfiles'
-        }
-        return dir_name.lower() in key_dirs
+        return dir_name.lower() in self.KEY_DIRECTORIES
     
     def get_file_size(self, file_path: Path) -> int:
         """Get file size safely"""
@@ -189,6 +1640,23 @@ class FolderTreeGenerator:
         except (OSError, PermissionError):
             return 0
     
+    def get_file_mtime(self, file_path: Path) -> float:
+        """Get file modification time safely"""
+        try:
+            return file_path.stat().st_mtime
+        except (OSError, PermissionError):
+            return 0.0
+    
+    FILE_ORDERS = ('name', 'largest', 'newest')
+    
+    def _file_sort_key(self):
+        """Sort key for files under the configured file_order"""
+        if self.file_order == 'largest':
+            return lambda e: (-self.get_file_size(e), e.name.lower())
+        if self.file_order == 'newest':
+            return lambda e: (-self.get_file_mtime(e), e.name.lower())
+        return lambda e: e.name.lower()
+    
     def format_size(self, size_bytes: int) -> str:
         """Format file size in human readable format"""
         if size_bytes == 0:
@@ -203,137 +1671,490 @@ class FolderTreeGenerator:
         return f"{size_bytes:.1f} {size_names[i]}"
     
     def should_include_file(self, file_path: Path, include_categories: Optional[Set[str]] = None,
-                           exclude_patterns: Optional[Set[str]] = None) -> bool:
-        """Check if file should be included based on filters"""
+                           exclude_patterns: Union[Set[str], PatternMatcher, None] = None,
+                           is_dir: Optional[bool] = None) -> bool:
+        """Check if file should be included based on filters (patterns may be pre-compiled)"""
         if exclude_patterns:
-            for pattern in exclude_patterns:
-                if pattern in file_path.name:
-                    return False
-        
-        if include_categories and not file_path.is_dir():
-            ext = file_path.suffix.lower()
-            for category in include_categories:
-                if ext in self.file_categories.get(category, set()):
-                    return True
-            return False
+            if not isinstance(exclude_patterns, PatternMatcher):
+                exclude_patterns = PatternMatcher(exclude_patterns)
+            if exclude_patterns.matches(file_path.name, os.fspath(file_path)):
+                return False
+        
+        if include_categories:
+            if is_dir is None:
+                is_dir = file_path.is_dir()
+            if is_dir:
+                return True
+            return self.classify_file(file_path.name)[1] in include_categories
         
         return True
     
     def generate_tree(self, root_path: str, show_size: bool = False, 
                      show_hidden: bool = False, sort_dirs_first: bool = True,
                      include_categories: Optional[Set[str]] = None,
-                     exclude_patterns: Optional[Set[str]] = None) -> List[str]:
-        """Generate tree structure as list of strings"""
-        self.tree_lines = []
+                     exclude_patterns: Optional[Set[str]] = None) -> Sequence[str]:
+        """Generate tree structure as a list of strings.
+        
+        The scan is stored once in self.model; tree_lines renders lines from it
+        on demand, so a large tree does not keep every prefix string in memory.
+        """
+        model = TreeModel()
+        self._digests = array('Q')
+        try:
+            for node in self.iter_nodes(root_path, show_size, show_hidden, sort_dirs_first,
+                                        include_categories, exclude_patterns):
+                model.add_node(*node)
+            model.set_hashes(self._digests)
+        finally:
+            self._digests = None
+        model.show_size = show_size
+        model.stats = dict(self.stats)
+        
+        self.model = model
+        self.tree_lines = TreeLines(self, model)
+        return self.tree_lines
+    
+    def iter_tree(self, root_path: str, show_size: bool = False,
+                  show_hidden: bool = False, sort_dirs_first: bool = True,
+                  include_categories: Optional[Set[str]] = None,
+                  exclude_patterns: Optional[Set[str]] = None) -> Iterator[str]:
+        """Yield tree lines as the walk goes; stats are final once the iterator is exhausted.
+        
+        Nothing is kept in tree_lines, so memory stays flat however big the tree is.
+        With show_size a folder line needs its subtree total, so the lines below each
+        folder are held back until that folder is done.
+        """
+        nodes = self.iter_nodes(root_path, show_size, show_hidden, sort_dirs_first,
+                                include_categories, exclude_patterns)
+        return self._render_nodes(nodes, show_size)
+    
+    def iter_nodes(self, root_path: str, show_size: bool = False,
+                   show_hidden: bool = False, sort_dirs_first: bool = True,
+                   include_categories: Optional[Set[str]] = None,
+                   exclude_patterns: Optional[Set[str]] = None) -> Iterator[Node]:
+        """Yield (depth, kind, name, size, flags) node records in display order as the walk goes"""
         self.stats = {'folders': 0, 'files': 0, 'total_size': 0, 'truncated_folders': 0}
         
         root = Path(root_path).resolve()
         if not root.exists():
             raise FileNotFoundError(f"Path does not exist: {root_path}")
         
+        self._scan_root = os.fspath(root)
+        self._ignore_rules_cache = {}
+        
+        # Compile the exclude patterns once for the whole scan
+        if exclude_patterns:
+            exclude_patterns = PatternMatcher(exclude_patterns, root)
+        
         # Add root directory
-        root_icon = self.get_file_icon(root, is_key_folder=True)
-        root_line = f"{root_icon} {root.name}/"
-        if show_size and root.is_dir():
+        root_kind = TreeModel.KIND_DIR if root.is_dir() else TreeModel.KIND_FILE
+        self.stats['folders'] += 1
+        
+        # Generate tree recursively; the root total comes from the same pass.
+        # watch() installs an in-memory listing cache, which worker processes
+        # cannot share, so sharding is skipped while watching.
+        own_cache = self._cache is None
+        with ExitStack() as stack:
+            if own_cache and self.cache_path:
+                self._cache = stack.enter_context(ScanCache(self.cache_path))
+            if self.workers and self.workers > 1:
+                self._executor = stack.enter_context(ThreadPoolExecutor(max_workers=self.workers))
+            if own_cache and self.processes and self.processes > 1:
+                self._process_pool = stack.enter_context(ProcessPoolExecutor(max_workers=self.processes))
             try:
-                total_size = sum(f.stat().st_size for f in root.rglob('*') if f.is_file())
-                root_line += f" ({self.format_size(total_size)})"
-            except (OSError, PermissionError):
-                pass
+                nodes = self._build_tree(root, 0, show_size, show_hidden, sort_dirs_first,
+                                         include_categories, exclude_patterns)
+                if show_size:
+                    child_nodes = []
+                    total_size, root_hash = _collect(nodes, child_nodes)
+                    yield (0, root_kind, root.name, -1 if total_size is None else total_size, TreeModel.FLAG_KEY)
+                    yield from child_nodes
+                else:
+                    yield (0, root_kind, root.name, -1, TreeModel.FLAG_KEY)
+                    _total_size, root_hash = yield from nodes
+                if self._digests is not None and root_kind == TreeModel.KIND_DIR:
+                    self._digests.append(root_hash)
+            finally:
+                for future in list(self._prefetched.values()) + list(self._shards.values()):
+                    future.cancel()
+                self._prefetched = {}
+                self._shards = {}
+                self._executor = None
+                self._process_pool = None
+                if own_cache:
+                    self._cache = None
+    
+    def _render_nodes(self, nodes: Iterable[Node], show_size: bool) -> Iterator[str]:
+        """Render node records into tree lines, tracking the prefix below each open folder"""
+        style = self.style
+        child_prefixes = ['']
+        for node in nodes:
+            depth, kind, _name, _size, flags = node
+            if depth == 0:
+                yield self._format_node('', node, show_size)
+                continue
+            
+            prefix = child_prefixes[depth - 1]
+            if kind == TreeModel.KIND_DIR:
+                child_prefixes[depth:] = [prefix + (style['space'] if flags & TreeModel.FLAG_LAST else style['vertical'])]
+            yield self._format_node(prefix, node, show_size)
+    
+    def _format_node(self, prefix: str, node: Node, show_size: bool) -> str:
+        """Format one node record as a tree line below the given prefix"""
+        depth, kind, name, size, flags = node
+        if depth == 0:
+            # Root line: always shown as a folder, with its total when known
+            icon = self._icon_for(name, kind == TreeModel.KIND_DIR, is_key_folder=True)
+            line = f"{icon} {name}/"
+            if show_size and size >= 0:
+                line += f" ({self.format_size(size)})"
+            return line
         
-        self.tree_lines.append(root_line)
-        self.stats['folders'] += 1
+        # Build tree symbols with better spacing
+        prefix += self.style['corner'] if flags & TreeModel.FLAG_LAST else self.style['junction']
+        if kind == TreeModel.KIND_MORE:
+            return f"{prefix}... ({size} more files)"
         
-        # Generate tree recursively
-        self._build_tree(root, "", 0, show_size, show_hidden, sort_dirs_first,
-                        include_categories, exclude_patterns)
+        is_dir = kind == TreeModel.KIND_DIR
+        icon = self._icon_for(name, is_dir, is_key_folder=bool(flags & TreeModel.FLAG_KEY))
+        line = f"{prefix}{icon} {name}"
+        if is_dir:
+            line += "/"
+        if show_size and size >= 0:
+            line += f" ({self.format_size(size)})"
+        return line
+    
+    def watch(self, root_path: str, on_change, debounce: float = 1.0,
+              ignore: Optional[Callable[[str], bool]] = None) -> None:
+        """Call on_change() once, then again after every burst of filesystem changes.
         
-        return self.tree_lines
+        on_change is expected to regenerate the tree (generate_tree/iter_tree).
+        Between runs the listings live in memory and are patched from inotify
+        events, so each update re-lists only the directories that changed; the
+        tree itself is rebuilt from those listings.
+        ignore is called with the full (resolved) path of an entry; entries it
+        accepts, such as the outputs on_change writes into the tree, are left out
+        of the scan and their changes never trigger a run.
+        Runs until interrupted (Ctrl+C).
+        """
+        with Inotify() as inotify:
+            self._cache = MemoryListingCache(inotify)
+            self._skip_path = ignore
+            try:
+                on_change()
+                while True:
+                    changed = False
+                    events = inotify.read_events()
+                    while events:
+                        for directory, mask, name in events:
+                            if ignore is not None and name and ignore(os.path.join(directory, name)):
+                                continue
+                            self._cache.apply_event(directory, mask, name)
+                            changed = True
+                        events = inotify.read_events(timeout=debounce)
+                    if changed:
+                        on_change()
+            finally:
+                self._cache = None
+                self._skip_path = None
     
-    def _build_tree(self, directory: Path, prefix: str, depth: int, show_size: bool,
-                   show_hidden: bool, sort_dirs_first: bool, include_categories: Optional[Set[str]],
-                   exclude_patterns: Optional[Set[str]]) -> None:
-        """Recursively build tree structure with smart file limiting"""
-        if depth >= self.max_depth:
-            return
+    def _scan_directory(self, directory: Union[str, Path], show_size: bool, show_hidden: bool,
+                        include_categories: Optional[Set[str]],
+                        exclude_patterns: Optional[PatternMatcher]) -> Optional[Listing]:
+        """List a directory once and split it into directories, displayed files and hidden files.
         
+        Each entry is classified from its d_type, so only symlinks cost a stat here.
+        Entries that are neither (broken links, sockets, fifos) are dropped.
+        Returns None if the directory cannot be read.
+        """
+        directories = []
+        files = []
+        ignore_rules = self._ignore_rules(os.fspath(directory)) if self.respect_gitignore else ()
+        skip = self._skip_path
         try:
-            entries = list(directory.iterdir())
-        except (OSError, PermissionError):
+            for entry, is_dir in self._iter_entries(directory, show_hidden):
+                if skip is not None and skip(entry.path):
+                    continue
+                # git never tracks its own .git (a folder, or a file in worktrees and submodules)
+                if self.respect_gitignore and entry.name == '.git':
+                    continue
+                if not self.should_include_file(entry, include_categories, exclude_patterns, is_dir=is_dir):
+                    continue
+                if ignore_rules and is_ignored(ignore_rules, entry.path, is_dir):
+                    continue
+                (directories if is_dir else files).append(entry)
+        except OSError:
+            return None
+        
+        # Directories are always listed before files, so sorting each group by
+        # name gives the same order for both values of sort_dirs_first
+        directories.sort(key=lambda e: e.name.lower())
+        
+        # With a file limit only the displayed files are selected (and sorted);
+        # the rest are just counted, and only kept when their sizes are needed
+        key = self._file_sort_key()
+        limit = self.max_files_per_folder
+        if limit and 0 < limit < len(files):
+            displayed = heapq.nsmallest(limit, files, key=key)
+            hidden = []
+            if show_size:
+                selected = set(map(id, displayed))
+                hidden = [e for e in files if id(e) not in selected]
+            return directories, displayed, len(files) - limit, hidden
+        
+        files.sort(key=key)
+        return directories, files, 0, []
+    
+    IGNORE_FILES = ('.gitignore', '.treeignore')
+    
+    def _ignore_rules(self, directory: str) -> Tuple[GitIgnore, ...]:
+        """Ignore files that apply inside directory, outermost first.
+        
+        Each folder's rules are its parent's plus its own files, compiled once
+        and cached, so ignored folders are pruned before they are ever listed.
+        """
+        rules = self._ignore_rules_cache.get(directory)
+        if rules is None:
+            parent = os.path.dirname(directory)
+            inherited = ()
+            if directory != self._scan_root and parent != directory:
+                inherited = self._ignore_rules(parent)
+            own = tuple(rule_file for rule_file in (GitIgnore.load(os.path.join(directory, name), directory)
+                                                    for name in self.IGNORE_FILES) if rule_file is not None)
+            rules = self._ignore_rules_cache[directory] = inherited + own
+        return rules
+    
+    def _iter_entries(self, directory: Union[str, Path], show_hidden: bool) -> Iterator[Tuple[os.DirEntry, bool]]:
+        """Yield (entry, is_dir) for the directories and files in directory, from the scan cache if enabled"""
+        if self._cache is not None:
+            for entry in self._cache.list_directory(directory):
+                if show_hidden or not entry.name.startswith('.'):
+                    yield entry, entry.is_dir()
             return
         
-        # Filter entries
-        if not show_hidden:
-            entries = [e for e in entries if not e.name.startswith('.')]
+        with os.scandir(directory) as it:
+            for entry in it:
+                if not show_hidden and entry.name.startswith('.'):
+                    continue
+                is_dir = classify_entry(entry)
+                if is_dir is not None:
+                    yield entry, is_dir
+    
+    def _prefetch_directory(self, directory: str, show_size: bool, show_hidden: bool,
+                            include_categories: Optional[Set[str]],
+                            exclude_patterns: Optional[PatternMatcher]) -> Optional[Listing]:
+        """Worker task for the parallel walker: list a directory and stat the files that will be sized.
         
-        entries = [e for e in entries if self.should_include_file(e, include_categories, exclude_patterns)]
+        DirEntry caches its stat result, so the sizes read later by _build_tree
+        cost no further round trips.
+        """
+        listing = self._scan_directory(directory, show_size, show_hidden, include_categories, exclude_patterns)
+        if listing is not None:
+            for entry in listing[1] + listing[3]:
+                self.get_file_size(entry)
+        return listing
+    
+    def _build_tree(self, directory: Union[str, Path], depth: int, show_size: bool,
+                   show_hidden: bool, sort_dirs_first: bool, include_categories: Optional[Set[str]],
+                   exclude_patterns: Optional[PatternMatcher]) -> Iterator[Node]:
+        """Recursively yield the node records below a directory, with smart file limiting.
+        
+        The generator returns (total size of the files found below this directory,
+        Merkle hash of its listing), or (None, 0) if it was not scanned (depth
+        limit or unreadable). The hash covers each child's name, kind, size and
+        mtime, and a folder's hash stands for its subtree, so it changes whenever
+        anything shown below the directory does.
+        With show_size, each directory record carries its subtree total, so its
+        children are held back until they are done.
+        """
+        if depth >= self.max_depth:
+            return None, 0
         
-        # Sort entries
-        if sort_dirs_first:
-            entries.sort(key=lambda x: (x.is_file(), x.name.lower()))
+        future = self._prefetched.pop(str(directory), None)
+        if future is not None:
+            listing = future.result()
         else:
-            entries.sort(key=lambda x: x.name.lower())
-        
-        # Smart file limiting: separate directories and files
-        directories = [e for e in entries if e.is_dir()]
-        files = [e for e in entries if e.is_file()]
-        
-        # Apply file limit if specified
-        files_truncated = False
-        if self.max_files_per_folder and len(files) > self.max_files_per_folder:
-            displayed_files = files[:self.max_files_per_folder]
-            hidden_count = len(files) - self.max_files_per_folder
-            files_truncated = True
+            listing = self._scan_directory(directory, show_size, show_hidden, include_categories, exclude_patterns)
+        if listing is None:
+            return None, 0
+        directories, displayed_files, hidden_count, hidden_files = listing
+        subtree_size = 0
+        hasher = hashlib.blake2b(digest_size=8)
+        
+        # Sharded scan: each top-level subtree is built in its own process and
+        # stitched back in below, in the same order
+        if self._process_pool is not None and depth == 0 and depth + 1 < self.max_depth:
+            for entry in directories:
+                self._shards[entry.path] = self._process_pool.submit(
+                    _scan_shard, self._shard_options(), entry.path, depth + 1, show_size,
+                    show_hidden, sort_dirs_first, include_categories, exclude_patterns)
+        
+        # Parallel walker: list all subdirectories on the pool while this thread
+        # walks them one by one, so output order stays depth-first
+        elif self._executor is not None and depth + 1 < self.max_depth:
+            for entry in directories:
+                self._prefetched[entry.path] = self._executor.submit(
+                    self._prefetch_directory, entry.path, show_size, show_hidden,
+                    include_categories, exclude_patterns)
+        
+        # File limit already applied by _scan_directory
+        files_truncated = hidden_count > 0
+        hidden_size = 0
+        if files_truncated:
             self.stats['truncated_folders'] += 1
-        else:
-            displayed_files = files
-            hidden_count = 0
+            if show_size:
+                # Hidden files still count towards the folder's own size
+                hidden_size = sum(self.get_file_size(e) for e in hidden_files)
+                subtree_size += hidden_size
         
         # Combine directories (always show all) with limited files
         entries_to_show = directories + displayed_files
+        num_dirs = len(directories)
+        child_depth = depth + 1
         
         for i, entry in enumerate(entries_to_show):
             is_last_entry = i == len(entries_to_show) - 1 and not files_truncated
+            flags = TreeModel.FLAG_LAST if is_last_entry else 0
             
-            # Build tree symbols with better spacing
-            if is_last_entry:
-                current_prefix = prefix + self.style['corner']
-                next_prefix = prefix + self.style['space']
-            else:
-                current_prefix = prefix + self.style['junction']
-                next_prefix = prefix + self.style['vertical']
-            
-            # Get icon and build line
-            is_key = self.is_key_directory(entry.name) if entry.is_dir() else False
-            icon = self.get_file_icon(entry, is_key_folder=is_key)
-            line = f"{current_prefix}{icon} {entry.name}"
-            
-            if entry.is_dir():
-                line += "/"
-                self.stats['folders'] += 1
-            else:
+            if i >= num_dirs:
                 self.stats['files'] += 1
                 file_size = self.get_file_size(entry)
                 self.stats['total_size'] += file_size
-                
-                if show_size:
-                    line += f" ({self.format_size(file_size)})"
+                subtree_size += file_size
+                hasher.update(_stamp(entry.name, TreeModel.KIND_FILE, file_size, self.get_file_mtime(entry)))
+                yield (child_depth, TreeModel.KIND_FILE, entry.name, file_size, flags)
+                continue
             
-            self.tree_lines.append(line)
+            if self.is_key_directory(entry.name):
+                flags |= TreeModel.FLAG_KEY
+            self.stats['folders'] += 1
             
             # Recurse into directories
-            if entry.is_dir():
-                self._build_tree(entry, next_prefix, depth + 1, show_size, show_hidden,
-                               sort_dirs_first, include_categories, exclude_patterns)
+            shard = self._shards.pop(entry.path, None)
+            if shard is not None:
+                child_nodes = self._merge_shard(shard.result())
+            else:
+                child_nodes = self._build_tree(entry.path, child_depth, show_size, show_hidden,
+                                               sort_dirs_first, include_categories, exclude_patterns)
+            if show_size:
+                buffered = []
+                child_size, child_hash = _collect(child_nodes, buffered)
+                yield (child_depth, TreeModel.KIND_DIR, entry.name,
+                       -1 if child_size is None else child_size, flags)
+                yield from buffered
+            else:
+                yield (child_depth, TreeModel.KIND_DIR, entry.name, -1, flags)
+                child_size, child_hash = yield from child_nodes
+            if child_size is not None:
+                subtree_size += child_size
+            hasher.update(_stamp(entry.name, TreeModel.KIND_DIR, child_hash))
+            if self._digests is not None:
+                self._digests.append(child_hash)
         
         # Add truncation indicator if files were hidden
         if files_truncated:
-            truncation_prefix = prefix + self.style['corner'] if len(entries_to_show) > 0 else prefix + self.style['junction']
-            truncation_line = f"{truncation_prefix}... ({hidden_count} more files)"
-            self.tree_lines.append(truncation_line)
+            flags = TreeModel.FLAG_LAST if len(entries_to_show) > 0 else 0
+            hasher.update(_stamp('', TreeModel.KIND_MORE, hidden_count, hidden_size))
+            yield (child_depth, TreeModel.KIND_MORE, '', hidden_count, flags)
+        
+        return subtree_size, int.from_bytes(hasher.digest(), 'little')
+    
+    def _shard_options(self) -> Dict:
+        """Generator settings a shard worker needs to reproduce this scan"""
+        return {
+            'max_depth': self.max_depth,
+            'max_files_per_folder': self.max_files_per_folder,
+            'workers': self.workers,
+            'cache_path': self.cache_path,
+            'respect_gitignore': self.respect_gitignore,
+            'scan_root': self._scan_root,
+            'file_order': self.file_order,
+        }
+    
+    def _merge_shard(self, shard: Tuple[List[Node], Dict, Tuple[Optional[int], int], array]) -> Iterator[Node]:
+        """Yield a shard's node records, merge its stats and folder hashes and return (size, hash)"""
+        nodes, stats, result, digests = shard
+        for key, value in stats.items():
+            self.stats[key] += value
+        if self._digests is not None:
+            self._digests.extend(digests)
+        yield from nodes
+        return result
+    
+    OUTPUT_FORMATS = {'txt': '.txt', 'png': '.png', 'pdf': '.pdf'}
+    
+    def save_formats(self, base_path: str, formats: Iterable[str], font_size: int = 12,
+                     page_size: str = 'A4', parallel: bool = False,
+                     png_pages: bool = False, dpi: int = 150, png_mode: str = 'RGB',
+                     compress_level: int = 6, symbol_font: Optional[str] = None) -> List[str]:
+        """Save the last generated tree in several formats from a single scan.
+        
+        formats holds 'txt', 'png', 'pdf' or 'all'; each file is base_path plus
+        the format's extension. With parallel, each renderer runs in its own
+        process, so the total time is about that of the slowest one.
+        With png_pages, the PNG is written as pages (see save_png_pages);
+        png_mode and compress_level are passed on as save_png's mode and compress_level,
+        symbol_font to save_pdf.
+        Returns the paths written.
+        """
+        if self.model is None:
+            raise ValueError("No tree to save; call generate_tree() first")
+        
+        formats = list(self.OUTPUT_FORMATS) if 'all' in formats else list(dict.fromkeys(formats))
+        # Formats rendered side by side draw their PNG in a single process
+        options = {'font_size': font_size, 'page_size': page_size, 'png_pages': png_pages, 'dpi': dpi,
+                   'png_mode': png_mode, 'compress_level': compress_level, 'symbol_font': symbol_font,
+                   'processes': 1 if parallel and len(formats) > 1 else self.processes}
+        outputs = [(fmt, str(base_path) + self.OUTPUT_FORMATS[fmt]) for fmt in formats]
+        
+        if parallel and len(outputs) > 1:
+            with ProcessPoolExecutor(max_workers=len(outputs)) as pool:
+                futures = [pool.submit(_render_format, self, fmt, path, options) for fmt, path in outputs]
+                return [saved for future in futures for saved in future.result()]
+        
+        return [saved for fmt, path in outputs for saved in self._save_format(fmt, path, options)]
     
-    def save_text(self, output_path: str, header: bool = True, root_path: str = "") -> None:
-        """Save tree as text file with beautiful header"""
+    def _save_format(self, fmt: str, output_path: str, options: Dict) -> List[str]:
+        """Dispatch to the save_* method for one output format and return the paths written"""
+        if fmt == 'png':
+            if options['png_pages']:
+                return self.save_png_pages(output_path, font_size=options['font_size'],
+                                           page_size=options['page_size'], dpi=options['dpi'],
+                                           mode=options['png_mode'], compress_level=options['compress_level'],
+                                           processes=options['processes'])
+            self.save_png(output_path, font_size=options['font_size'], mode=options['png_mode'],
+                          compress_level=options['compress_level'], processes=options['processes'])
+        elif fmt == 'pdf':
+            self.save_pdf(output_path, page_size=options['page_size'], symbol_font=options['symbol_font'])
+        else:
+            self.save_text(output_path)
+        return [output_path]
+    
+    def _render_key(self, fmt: str, **options) -> Optional[str]:
+        """Render cache key for the current tree saved as fmt with options, or None if not cached.
+        
+        Only a scanned tree (a model with a hash) is cached, not lines passed in.
+        """
+        if self.render_cache is None or self.model is None or not self.model.tree_hash:
+            return None
+        return RenderCache.key({'format': fmt, 'tree': self.model.tree_hash, 'root': self.model.node(0)[2],
+                                'show_size': self.model.show_size, 'max_files': self.max_files_per_folder,
+                                'style': self.style, 'icons': self.icon_set, **options})
+    
+    def save_text(self, output_path: str, header: bool = True, root_path: str = "",
+                  lines: Optional[Iterable[str]] = None) -> None:
+        """Save tree as text file with beautiful header.
+        
+        Pass lines (e.g. from iter_tree) to write them as they are produced
+        instead of using tree_lines. With a render cache, an identical earlier
+        output is copied instead (keeping the date it was generated on).
+        """
+        key = None
+        if lines is None:
+            lines = self.tree_lines
+            key = self._render_key('txt', header=header, root_path=root_path)
+            if key and self.render_cache.fetch(key, output_path):
+                return
         with open(output_path, 'w', encoding='utf-8') as f:
             if header:
                 # Beautiful header like the original
@@ -359,7 +2180,7 @@ class FolderTreeGenerator:
                 f.write("🎬 - Video File\n")
                 f.write("-" * 80 + "\n\n")
             
-            for line in self.tree_lines:
+            for line in lines:
                 f.write(line + "\n")
                 
             if header:
@@ -367,60 +2188,303 @@ class FolderTreeGenerator:
                 f.write(f"Total Folders: {self.stats['folders']}\n")
                 f.write(f"Total Files: {self.stats['files']}\n") 
                 f.write(f"Total Size: {self.format_size(self.stats['total_size'])}\n")
+        if key:
+            self.render_cache.store(key, output_path)
     
-    def save_png(self, output_path: str, font_size: int = 12) -> None:
-        """Save tree as PNG image"""
-        if not PIL_AVAILABLE:
-            raise ImportError("PIL (Pillow) is required for PNG output. Install with: pip install Pillow")
+    def iter_records(self, nodes: Iterable[Node]) -> Iterator[Dict]:
+        """Turn node records into JSON-ready dicts, with paths relative to the root.
         
-        # Calculate image dimensions
-        max_line_length = max(len(line) for line in self.tree_lines) if self.tree_lines else 50
-        line_height = font_size + 4
-        img_width = max(800, max_line_length * (font_size // 2))
-        img_height = max(600, len(self.tree_lines) * line_height + 100)
+        Folders and files give path, depth, kind, size and category; a folder's
+        hidden files (max_files_per_folder) give a 'truncated' record with their
+        count in hidden_files. Sizes of folders are only known with show_size.
+        """
+        folder_paths = ['']
+        for depth, kind, name, size, flags in nodes:
+            if depth == 0:
+                folder_paths = ['']
+                yield {'path': '.', 'depth': 0, 'kind': 'dir' if kind == TreeModel.KIND_DIR else 'file',
+                       'size': size if size >= 0 else None, 'category': None, 'key': True}
+                continue
+            
+            parent = folder_paths[depth - 1]
+            if kind == TreeModel.KIND_MORE:
+                yield {'path': parent.rstrip('/') or '.', 'depth': depth, 'kind': 'truncated',
+                       'size': None, 'category': None, 'hidden_files': size}
+            elif kind == TreeModel.KIND_DIR:
+                folder_paths[depth:] = [f"{parent}{name}/"]
+                yield {'path': parent + name, 'depth': depth, 'kind': 'dir',
+                       'size': size if size >= 0 else None, 'category': None,
+                       'key': bool(flags & TreeModel.FLAG_KEY)}
+            else:
+                yield {'path': parent + name, 'depth': depth, 'kind': 'file',
+                       'size': size if size >= 0 else None, 'category': self.classify_file(name)[1]}
+    
+    def save_json(self, output_path: str, nodes: Optional[Iterable[Node]] = None, root_path: str = "") -> None:
+        """Save the tree as JSON, or as NDJSON (one record per line) for a .ndjson path.
         
-        # Create image
-        img = Image.new('RGB', (img_width, img_height), color='white')
-        draw = ImageDraw.Draw(img)
+        Records come from iter_records and are written one at a time; pass nodes
+        (e.g. from iter_nodes) to write them as the walk goes instead of using
+        the last generated model. JSON output wraps the records as
+        {"root", "generated", "nodes", "stats"}, with stats at the end since they
+        are only complete once the walk is done.
+        """
+        if nodes is None:
+            nodes = self.model.iter_nodes()
+        records = self.iter_records(nodes)
         
-        # Try to load a font
+        with open(output_path, 'w', encoding='utf-8') as f:
+            if str(output_path).lower().endswith('.ndjson'):
+                for record in records:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                return
+            
+            f.write('{"root": %s, "generated": %s, "nodes": [' % (
+                json.dumps(os.fspath(Path(root_path).resolve()) if root_path else None),
+                json.dumps(datetime.now().strftime('%Y-%m-%d %H:%M:%S'))))
+            separator = "\n"
+            for record in records:
+                f.write(separator + json.dumps(record, ensure_ascii=False))
+                separator = ",\n"
+            f.write('\n], "stats": %s}\n' % json.dumps(self.stats))
+    
+    def save_snapshot(self, output_path: str, root_path: str = "") -> None:
+        """Save the last generated tree as a binary snapshot (see TreeSnapshot)"""
+        if self.model is None:
+            raise ValueError("No tree to save; call generate_tree() first")
+        TreeSnapshot.write(output_path, self.model, root_path)
+    
+    def load_tree(self, source: str, **tree_options):
+        """Model of a snapshot file or, for a folder, of a fresh scan (with tree_options)"""
+        if TreeSnapshot.is_snapshot(source):
+            return TreeSnapshot(source)
+        self.generate_tree(source, **tree_options)
+        return self.model
+    
+    def diff(self, old_source: str, new_source: str, **tree_options) -> TreeDiff:
+        """Compare two folders or snapshots (see TreeDiff); folders are scanned with tree_options"""
+        return TreeDiff(self.load_tree(old_source, **tree_options), self.load_tree(new_source, **tree_options))
+    
+    def load_snapshot(self, snapshot_path: str) -> Sequence[str]:
+        """Load a snapshot in place of a scan, so the save_* methods re-render it"""
+        snapshot = TreeSnapshot(snapshot_path)
+        self.model = snapshot
+        self.stats = dict(snapshot.stats)
+        self.tree_lines = TreeLines(self, snapshot)
+        return self.tree_lines
+    
+    # Paper sizes in inches for paginated PNG output
+    PNG_PAGE_SIZES = {'A4': (8.27, 11.69), 'letter': (8.5, 11.0)}
+    
+    # Most lines drawn per band when save_png renders in several processes
+    PNG_BAND_LINES = 1000
+    
+    # Image modes for PNG output: 24-bit colour, 8-bit grey, 16-grey palette, 1-bit
+    PNG_MODES = ('RGB', 'L', 'P', '1')
+    
+    def _new_png_image(self, size: Tuple[int, int], mode: str = 'RGB'):
+        """Blank white image in one of PNG_MODES, with a Draw for it and the ink to use"""
+        if mode == 'P':
+            # Linear 16-level grey ramp (black first, white last): antialiased text
+            # blends palette indices like grey levels, and PIL saves it 4 bits per pixel
+            img = Image.new('P', size, 15)
+            img.putpalette([level * 17 for level in range(16) for _ in range(3)])
+            draw = ImageDraw.Draw(img)
+            draw.fontmode = 'L'
+            return img, draw, 0
+        img = Image.new(mode, size, color='white')
+        return img, ImageDraw.Draw(img), 'black'
+    
+    def _load_font(self, font_size: int):
+        """Load the PNG font, falling back to PIL's built-in font"""
         try:
-            font = ImageFont.truetype("arial.ttf", font_size)
+            return ImageFont.truetype("arial.ttf", font_size)
         except OSError:
             try:
-                font = ImageFont.truetype("/System/Library/Fonts/Arial.ttf", font_size)
+                return ImageFont.truetype("/System/Library/Fonts/Arial.ttf", font_size)
             except OSError:
-                font = ImageFont.load_default()
-        
-        # Draw header
-        y_offset = 20
-        header_text = [
+                return ImageFont.load_default()
+    
+    def _png_header(self) -> List[str]:
+        """Header lines drawn at the top of a PNG"""
+        return [
             f"Folder Tree - Generated {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
             f"Folders: {self.stats['folders']} | Files: {self.stats['files']} | Size: {self.format_size(self.stats['total_size'])}"
         ]
+    
+    def _draw_png_lines(self, draw, lines: Iterable[str], y_offset: int, line_height: int, font,
+                        glyphs: Optional[GlyphCache] = None, fill='black') -> int:
+        """Draw lines top to bottom from y_offset and return the y after the last one.
         
-        for header_line in header_text:
-            draw.text((20, y_offset), header_line, fill='black', font=font)
+        Tree lines pass glyphs so their prefixes and icons are pasted from the cache.
+        """
+        for line in lines:
+            if glyphs is not None:
+                glyphs.draw_line(draw, (20, y_offset), line, fill)
+            else:
+                draw.text((20, y_offset), line, fill=fill, font=font)
             y_offset += line_height
+        return y_offset
+    
+    def save_png(self, output_path: str, font_size: int = 12, mode: str = 'RGB',
+                 compress_level: int = 6, processes: Optional[int] = None) -> None:
+        """Save tree as PNG image.
         
-        y_offset += 10
+        mode is one of PNG_MODES; 'L', 'P' and '1' need a quarter of the memory of
+        'RGB' while drawing and give much smaller files. compress_level is zlib's (0-9).
+        With processes > 1 (default: the generator's processes), bands of lines are
+        drawn in a process pool and pasted into the image in order.
+        With a render cache, an identical earlier image is copied instead.
+        """
+        if not PIL_AVAILABLE:
+            raise ImportError("PIL (Pillow) is required for PNG output. Install with: pip install Pillow")
         
-        # Draw tree lines
-        for line in self.tree_lines:
-            draw.text((20, y_offset), line, fill='black', font=font)
-            y_offset += line_height
+        key = self._render_key('png', font_size=font_size, mode=mode, compress_level=compress_level)
+        if key and self.render_cache.fetch(key, output_path):
+            return
+        
+        # Calculate image dimensions
+        max_line_length = max(len(line) for line in self.tree_lines) if self.tree_lines else 50
+        line_height = font_size + 4
+        img_width = max(800, max_line_length * (font_size // 2))
+        img_height = max(600, len(self.tree_lines) * line_height + 100)
+        
+        processes = self.processes if processes is None else processes
+        header = self._png_header()
+        y_offset = 20 + len(header) * line_height + 10
         
-        img.save(output_path)
+        if not processes or processes <= 1:
+            img = _render_png_band(self.style, header, self.tree_lines, (img_width, img_height),
+                                   y_offset, font_size, mode)
+            img.save(output_path, compress_level=compress_level)
+            if key:
+                self.render_cache.store(key, output_path)
+            return
+        
+        # Bands of at most PNG_BAND_LINES lines, a few per process, with only a
+        # couple of bands per process in flight at once
+        img, _, _ = self._new_png_image((img_width, img_height), mode)
+        band_lines = max(1, min(self.PNG_BAND_LINES, math.ceil(len(self.tree_lines) / (processes * 4))))
+        lines = iter(self.tree_lines)
+        pending = []
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            # The first band also holds the header
+            band_header, band_y, band_top = header, y_offset, 0
+            while True:
+                band = list(itertools.islice(lines, band_lines))
+                if not band and not band_header:
+                    break
+                band_height = band_y + len(band) * line_height
+                pending.append((band_top, pool.submit(_render_png_band, self.style, band_header, band,
+                                                      (img_width, band_height), band_y, font_size, mode)))
+                band_header, band_y, band_top = [], 0, band_top + band_height
+                if len(pending) >= 2 * processes:
+                    top, future = pending.pop(0)
+                    img.paste(future.result(), (0, top))
+            for top, future in pending:
+                img.paste(future.result(), (0, top))
+        
+        img.save(output_path, compress_level=compress_level)
+        if key:
+            self.render_cache.store(key, output_path)
+    
+    def save_png_pages(self, output_path: str, font_size: int = 12, page_size: str = 'A4',
+                       dpi: int = 150, mode: str = 'RGB', compress_level: int = 6,
+                       processes: Optional[int] = None) -> List[str]:
+        """Save tree as a series of fixed-size PNG pages plus a JSON index.
+        
+        Pages are named after output_path (tree.png gives tree-001.png, tree-002.png, ...)
+        and are drawn and written one at a time, so memory stays at one page however
+        large the tree is. The index (tree-index.json) lists the tree lines on each page.
+        mode, compress_level and processes are as for save_png; with processes > 1
+        each process draws and writes whole pages, a couple at a time.
+        Returns the paths written, index last.
+        """
+        if not PIL_AVAILABLE:
+            raise ImportError("PIL (Pillow) is required for PNG output. Install with: pip install Pillow")
+        
+        # Page dimensions; pages widen to fit the longest line rather than clip it
+        width_inches, height_inches = self.PNG_PAGE_SIZES.get(page_size, self.PNG_PAGE_SIZES['A4'])
+        margin = 20
+        line_height = font_size + 4
+        max_line_length = max((len(line) for line in self.tree_lines), default=0)
+        img_width = max(round(width_inches * dpi), max_line_length * (font_size // 2) + 2 * margin)
+        img_height = max(round(height_inches * dpi), 2 * margin + 4 * line_height)
+        
+        processes = self.processes if processes is None else processes
+        header = self._png_header()
+        base = Path(output_path)
+        stem, suffix = base.with_suffix(''), base.suffix or '.png'
+        lines = iter(self.tree_lines)
+        total_lines = len(self.tree_lines)
+        written, pages = [], []
+        first_line = 0
+        
+        with ExitStack() as stack:
+            pool = None
+            if processes and processes > 1:
+                pool = stack.enter_context(ProcessPoolExecutor(max_workers=processes))
+            pending = []
+            
+            while True:
+                # Only the first page carries the header
+                page_header = [] if pages else header
+                y_offset = margin + len(page_header) * line_height + (10 if page_header else 0)
+                page_lines = list(itertools.islice(lines, max(1, (img_height - margin - y_offset) // line_height)))
+                
+                page_path = f"{stem}-{len(pages) + 1:03d}{suffix}"
+                task = (self.style, page_header, page_lines, (img_width, img_height), y_offset,
+                        font_size, mode, page_path, compress_level)
+                if pool is None:
+                    _render_png_band(*task)
+                else:
+                    pending.append(pool.submit(_render_png_band, *task))
+                    if len(pending) >= 2 * processes:
+                        pending.pop(0).result()
+                
+                written.append(page_path)
+                pages.append({'file': Path(page_path).name,
+                              'first_line': first_line + 1,
+                              'last_line': first_line + len(page_lines)})
+                first_line += len(page_lines)
+                if first_line >= total_lines:
+                    break
+            
+            for future in pending:
+                future.result()
+        
+        index_path = f"{stem}-index.json"
+        with open(index_path, 'w', encoding='utf-8') as f:
+            json.dump({'generated': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                       'page_size': page_size, 'dpi': dpi, 'mode': mode,
+                       'page_width': img_width, 'page_height': img_height,
+                       'lines': total_lines, 'stats': self.stats, 'pages': pages}, f, indent=2)
+        written.append(index_path)
+        return written
     
-    def save_pdf(self, output_path: str, page_size='A4') -> None:
-        """Save tree as PDF"""
+    def save_pdf(self, output_path: str, page_size='A4', lines: Optional[Iterable[str]] = None,
+                 symbol_font: Optional[str] = None) -> None:
+        """Save tree as PDF.
+        
+        Each page's lines go out as a single text object. Pass lines (e.g. from
+        iter_tree) to draw them as they are produced instead of using tree_lines;
+        the header's statistics are filled in once the last line is drawn.
+        Prefix symbols and icons outside Helvetica are drawn as cached forms
+        (see PdfGlyphForms), from symbol_font if given or a known system font.
+        With a render cache, an identical earlier PDF of tree_lines is copied instead.
+        """
         if not REPORTLAB_AVAILABLE:
             raise ImportError("ReportLab is required for PDF output. Install with: pip install reportlab")
         
+        key = None
+        if lines is None:
+            key = self._render_key('pdf', page_size=page_size, symbol_font=symbol_font)
+            if key and self.render_cache.fetch(key, output_path):
+                return
+        
         page_size_map = {'A4': A4, 'letter': letter}
         page_width, page_height = page_size_map.get(page_size, A4)
         
-        c = canvas.Canvas(output_path, pagesize=(page_width, page_height))
+        c = canvas.Canvas(output_path, pagesize=(page_width, page_height), pageCompression=1)
         
         # Set up fonts and spacing
         font_name = "Helvetica"
@@ -437,22 +2501,194 @@ class FolderTreeGenerator:
         c.setFont(font_name, 10)
         c.drawString(margin, y_position, f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
         y_position -= line_height
-        c.drawString(margin, y_position, f"Folders: {self.stats['folders']} | Files: {self.stats['files']} | Total Size: {self.format_size(self.stats['total_size'])}")
+        stats_position = y_position
+        c.doForm('tree_stats')
         
         y_position -= 30
         
-        # Tree content
-        c.setFont(font_name, 8)
-        for line in self.tree_lines:
-            if y_position < margin:
-                c.showPage()
-                y_position = page_height - margin
-                c.setFont(font_name, 8)
+        # Tree content, a page at a time; lines run down to the bottom margin
+        glyphs = PdfGlyphForms(c, self.style, font_name, 8, symbol_font)
+        lines = iter(self.tree_lines if lines is None else lines)
+        page_lines = list(itertools.islice(lines, int((y_position - margin) // line_height) + 1))
+        while True:
+            text = c.beginText(margin, y_position)
+            text.setFont(font_name, 8, leading=line_height)
+            if glyphs.fonts:
+                placements = glyphs.add_lines(text, page_lines, margin, y_position, line_height)
+                c.drawText(text)
+                glyphs.place(placements)
+            else:
+                text.textLines(page_lines, trim=0)
+                c.drawText(text)
             
-            c.drawString(margin, y_position, line)
-            y_position -= line_height
+            y_position = page_height - margin
+            page_lines = list(itertools.islice(lines, int((y_position - margin) // line_height) + 1))
+            if not page_lines:
+                break
+            c.showPage()
+        c.showPage()
+        
+        # The statistics are only complete now, so the header refers to them as a form
+        c.beginForm('tree_stats')
+        c.setFont(font_name, 10)
+        c.drawString(margin, stats_position, f"Folders: {self.stats['folders']} | Files: {self.stats['files']} | Total Size: {self.format_size(self.stats['total_size'])}")
+        c.endForm()
         
         c.save()
+        if key:
+            self.render_cache.store(key, output_path)
+
+def write_outputs(generator: FolderTreeGenerator, args: argparse.Namespace, tree_options: Dict,
+                  scanned: bool = False) -> None:
+    """Generate the tree, save or print it as requested on the command line, and print statistics.
+    
+    With scanned, generator.model already holds the scan of the path and is rendered as it is.
+    """
+    if args.diff:
+        write_diff(generator, args, tree_options)
+        return
+    
+    # A snapshot given in place of a folder is re-rendered without walking anything
+    from_snapshot = TreeSnapshot.is_snapshot(args.path)
+    if from_snapshot:
+        print("Loading snapshot...")
+        generator.load_snapshot(args.path)
+    elif not scanned:
+        print("Generating folder tree...")
+    have_model = from_snapshot or scanned
+    
+    # Cached outputs are keyed by the tree hash, which needs the whole scan first
+    if generator.render_cache is not None and not have_model and (args.output or args.formats):
+        generator.generate_tree(args.path, **tree_options)
+        have_model = True
+    
+    def scan():
+        if not have_model:
+            generator.generate_tree(args.path, **tree_options)
+    
+    def lines():
+        # None renders tree_lines (and lets the render cache be used)
+        return None if have_model else generator.iter_tree(args.path, **tree_options)
+    
+    def nodes():
+        return generator.model.iter_nodes() if have_model else generator.iter_nodes(args.path, **tree_options)
+    
+    # Determine output format and save
+    if args.formats:
+        # Scan once and render every requested format from the same model
+        base_path = Path(args.output).with_suffix('') if args.output else Path('folder_tree')
+        scan()
+        for saved in generator.save_formats(base_path, args.formats, font_size=args.font_size,
+                                            page_size=args.page_size, parallel=args.parallel_render,
+                                            png_pages=args.png_pages, dpi=args.dpi, png_mode=args.png_mode,
+                                            compress_level=args.png_compression, symbol_font=args.symbol_font):
+            print(f"Tree saved as {Path(saved).suffix[1:].upper()}: {saved}")
+    elif args.output:
+        output_path = Path(args.output)
+        ext = output_path.suffix.lower()
+        
+        if ext == '.png' and args.png_pages:
+            scan()
+            *pages, index = generator.save_png_pages(args.output, font_size=args.font_size,
+                                                     page_size=args.page_size, dpi=args.dpi,
+                                                     mode=args.png_mode, compress_level=args.png_compression)
+            print(f"Tree saved as {len(pages)} PNG pages: {pages[0]} ... (index: {index})")
+        elif ext == '.png':
+            scan()
+            generator.save_png(args.output, font_size=args.font_size, mode=args.png_mode,
+                               compress_level=args.png_compression)
+            print(f"Tree saved as PNG: {args.output}")
+        elif ext == '.pdf':
+            generator.save_pdf(args.output, page_size=args.page_size,
+                               lines=lines(), symbol_font=args.symbol_font)
+            print(f"Tree saved as PDF: {args.output}")
+        elif ext in ('.json', '.ndjson'):
+            generator.save_json(args.output, nodes=nodes(),
+                                root_path=(generator.model.meta["root"] or "") if from_snapshot else args.path)
+            print(f"Tree saved as {ext[1:].upper()}: {args.output}")
+        elif ext == '.snap':
+            scan()
+            generator.save_snapshot(args.output,
+                                    root_path=(generator.model.meta["root"] or "") if from_snapshot else args.path)
+            print(f"Tree saved as snapshot: {args.output}")
+        else:  # Default to text, streamed straight to the file
+            generator.save_text(args.output, lines=lines())
+            print(f"Tree saved as text: {args.output}")
+    else:
+        # Print to console as the walk goes
+        for line in generator.tree_lines if have_model else lines():
+            print(line)
+    
+    # Print statistics
+    print(f"\nStatistics:")
+    print(f"  Folders: {generator.stats['folders']}")
+    print(f"  Files: {generator.stats['files']}")
+    print(f"  Total Size: {generator.format_size(generator.stats['total_size'])}")
+    if generator.stats['truncated_folders'] > 0:
+        print(f"  Folders with truncated file lists: {generator.stats['truncated_folders']}")
+
+def output_paths_matcher(args: argparse.Namespace) -> Callable[[str], bool]:
+    """Match the resolved paths of the files write_outputs writes (and the render cache folder)"""
+    def resolved(path) -> str:
+        path = os.path.abspath(path)
+        return os.path.join(os.path.realpath(os.path.dirname(path)), os.path.basename(path))
+    
+    outputs = []
+    if args.formats:
+        base_path = Path(args.output).with_suffix('') if args.output else Path('folder_tree')
+        formats = FolderTreeGenerator.OUTPUT_FORMATS if 'all' in args.formats else args.formats
+        outputs = [str(base_path) + FolderTreeGenerator.OUTPUT_FORMATS[fmt] for fmt in formats]
+    elif args.output:
+        outputs = [args.output]
+    
+    rules = [re.escape(resolved(path)) for path in outputs]
+    if args.render_cache:
+        rules.append(re.escape(os.path.realpath(args.render_cache)))
+    if args.png_pages:
+        # Pages are named tree-001.png, tree-002.png, ... next to tree-index.json
+        for path in outputs:
+            if Path(path).suffix.lower() == '.png':
+                stem = re.escape(resolved(Path(path).with_suffix('')))
+                rules.append(stem + r'-(?:\d{3,}' + re.escape(Path(path).suffix) + r'|index\.json)')
+    return re.compile('|'.join(rules)).fullmatch if rules else (lambda path: False)
+
+def watch_outputs(generator: FolderTreeGenerator, args: argparse.Namespace, tree_options: Dict) -> None:
+    """--watch: rescan after every burst of changes, and rewrite the outputs only when the tree hash changed.
+    
+    The outputs are left out of the watched tree, otherwise rewriting them would
+    change the tree and set off the next rewrite.
+    """
+    last_hash = None
+    
+    def on_change():
+        nonlocal last_hash
+        print("Generating folder tree...")
+        generator.generate_tree(args.path, **tree_options)
+        if generator.model.tree_hash == last_hash:
+            print("No changes to the tree; outputs left as they are.")
+            return
+        last_hash = generator.model.tree_hash
+        write_outputs(generator, args, tree_options, scanned=True)
+    
+    generator.watch(args.path, on_change, debounce=args.debounce, ignore=output_paths_matcher(args))
+
+def write_diff(generator: FolderTreeGenerator, args: argparse.Namespace, tree_options: Dict) -> None:
+    """Compare --diff OLD with the path and print the changes, or save them as text or JSON"""
+    print(f"Comparing {args.diff} -> {args.path}...")
+    diff = generator.diff(args.diff, args.path, **tree_options)
+    
+    if args.output and Path(args.output).suffix.lower() == '.json':
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(diff.to_json(), f, indent=2, ensure_ascii=False)
+        print(f"Diff saved as JSON: {args.output}")
+    elif args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            for line in diff.iter_lines(generator.format_size):
+                f.write(line + "\n")
+        print(f"Diff saved as text: {args.output}")
+    else:
+        for line in diff.iter_lines(generator.format_size):
+            print(line)
 
 def main():
     """Main function with argument parsing"""
@@ -464,13 +2700,24 @@ Examples:
   %(prog)s /path/to/folder                           # Simple text output
   %(prog)s /path/to/folder -o tree.png               # PNG output
   %(prog)s /path/to/folder -o tree.pdf               # PDF output
+  %(prog)s /path/to/folder -o tree.ndjson            # One JSON record per entry
+  %(prog)s /path/to/folder -o tree.snap              # Binary snapshot of the scan
+  %(prog)s tree.snap -o tree.pdf                     # Re-render a snapshot
+  %(prog)s /path/to/folder --diff yesterday.snap     # What changed since the snapshot
+  %(prog)s /path/to/folder --formats all             # TXT, PNG and PDF from one scan
   %(prog)s /path/to/folder --style artisanal --depth 5  # Detailed tree, 5 levels deep
   %(prog)s /path/to/folder --include-categories code images  # Only code and image files
         """
     )
     
-    parser.add_argument('path', help='Path to the folder to analyze')
-    parser.add_argument('-o', '--output', help='Output file (extension determines format: .txt, .png, .pdf)')
+    parser.add_argument('path', help='Path to the folder to analyze, or a snapshot (.snap) to re-render')
+    parser.add_argument('-o', '--output', help='Output file (extension determines format: .txt, .png, .pdf, .json, .ndjson, .snap)')
+    parser.add_argument('--diff', metavar='OLD',
+                       help='Compare OLD (folder or snapshot) with the path and list what changed (text, or -o .json)')
+    parser.add_argument('--formats', nargs='+', choices=['txt', 'png', 'pdf', 'all'],
+                       help='Save several formats from one scan (named after -o, default: folder_tree.*)')
+    parser.add_argument('--parallel-render', action='store_true',
+                       help='With --formats, run each renderer in its own process')
     parser.add_argument('--style', choices=['simple', 'professional', 'artisanal'], 
                        default='simple', help='Tree drawing style')
     parser.add_argument('--icons', choices=['simple', 'professional', 'artisanal'],
@@ -478,7 +2725,7 @@ Examples:
     parser.add_argument('--depth', type=int, choices=range(1, 11), default=3,
                        help='Maximum depth to traverse (1-10)')
     parser.add_argument('--show-size', action='store_true',
-                       help='Show file sizes')
+                       help='Show file sizes and recursive folder sizes')
     parser.add_argument('--show-hidden', action='store_true',
                        help='Include hidden files and folders')
     parser.add_argument('--no-sort-dirs', action='store_true',
@@ -487,13 +2734,42 @@ Examples:
                        choices=['documents', 'images', 'audio', 'video', 'code', 'archives'],
                        help='Only include specific file categories')
     parser.add_argument('--exclude-patterns', nargs='+',
-                       help='Exclude files/folders containing these patterns')
+                       help='Exclude files/folders containing these patterns '
+                            '(also globs like "*.pyc", "re:<regex>" and root-relative paths like "docs/_build")')
+    parser.add_argument('--gitignore', action='store_true',
+                       help='Skip files and folders ignored by .gitignore/.treeignore files')
     parser.add_argument('--max-files', type=int, default=None,
                        help='Maximum files to show per folder (default: unlimited, recommended: 5-10 for A4)')
+    parser.add_argument('--file-order', choices=FolderTreeGenerator.FILE_ORDERS, default='name',
+                       help='Order of files in each folder; with --max-files, which files are shown (default: name)')
     parser.add_argument('--font-size', type=int, default=12,
                        help='Font size for PNG output (default: 12)')
     parser.add_argument('--page-size', choices=['A4', 'letter'], default='A4',
-                       help='Page size for PDF output')
+                       help='Page size for PDF output and PNG pages')
+    parser.add_argument('--symbol-font', metavar='FONT',
+                       help='TrueType font for tree symbols and icons in PDF output (default: a known system font)')
+    parser.add_argument('--png-pages', action='store_true',
+                       help='Write PNG output as fixed-size pages (tree-001.png, ...) plus an index, using --page-size')
+    parser.add_argument('--dpi', type=int, default=150,
+                       help='Resolution of PNG pages with --png-pages (default: 150)')
+    parser.add_argument('--png-mode', choices=FolderTreeGenerator.PNG_MODES, default='RGB',
+                       help='PNG image mode: RGB, L (greyscale), P (16-grey palette) or 1 (black and white) (default: RGB)')
+    parser.add_argument('--png-compression', type=int, choices=range(0, 10), default=6, metavar='0-9',
+                       help='PNG zlib compression level (default: 6)')
+    parser.add_argument('--workers', type=int, default=1,
+                       help='List directories on N threads (helps on NFS/SMB mounts, default: 1)')
+    parser.add_argument('--processes', type=int, default=1,
+                       help='Scan top-level folders and draw PNG output in N processes (large trees, default: 1)')
+    parser.add_argument('--cache', metavar='DB',
+                       help='SQLite scan cache; only folders changed since the last run are re-listed')
+    parser.add_argument('--render-cache', metavar='DIR',
+                       help='Reuse PNG/PDF/TXT outputs rendered earlier from the same tree and options')
+    parser.add_argument('--render-cache-size', type=int, default=1024, metavar='MB',
+                       help='Size limit of the render cache; least recently used outputs go first (default: 1024)')
+    parser.add_argument('--watch', action='store_true',
+                       help='Keep running and rewrite the output whenever the tree changes (Linux)')
+    parser.add_argument('--debounce', type=float, default=1.0,
+                       help='Seconds of quiet to wait for before rewriting in --watch mode (default: 1.0)')
     parser.add_argument('--version', action='version', version='%(prog)s 2.0')
     
     args = parser.parse_args()
@@ -508,47 +2784,33 @@ Examples:
         style=args.style,
         icon_set=args.icons,
         max_depth=args.depth,
-        max_files_per_folder=args.max_files
+        max_files_per_folder=args.max_files,
+        workers=args.workers,
+        processes=args.processes,
+        cache_path=args.cache,
+        respect_gitignore=args.gitignore,
+        file_order=args.file_order,
+        render_cache=args.render_cache,
+        render_cache_size=args.render_cache_size * 1024 * 1024
+    )
+    
+    tree_options = dict(
+        show_size=args.show_size,
+        show_hidden=args.show_hidden,
+        sort_dirs_first=not args.no_sort_dirs,
+        include_categories=set(args.include_categories) if args.include_categories else None,
+        exclude_patterns=set(args.exclude_patterns) if args.exclude_patterns else None
     )
     
     try:
-        # Generate tree
-        print("Generating folder tree...")
-        tree_lines = generator.generate_tree(
-            args.path,
-            show_size=args.show_size,
-            show_hidden=args.show_hidden,
-            sort_dirs_first=not args.no_sort_dirs,
-            include_categories=set(args.include_categories) if args.include_categories else None,
-            exclude_patterns=set(args.exclude_patterns) if args.exclude_patterns else None
-        )
-        
-        # Determine output format and save
-        if args.output:
-            output_path = Path(args.output)
-            ext = output_path.suffix.lower()
-            
-            if ext == '.png':
-                generator.save_png(args.output, font_size=args.font_size)
-                print(f"Tree saved as PNG: {args.output}")
-            elif ext == '.pdf':
-                generator.save_pdf(args.output, page_size=args.page_size)
-                print(f"Tree saved as PDF: {args.output}")
-            else:  # Default to text
-                generator.save_text(args.output)
-                print(f"Tree saved as text: {args.output}")
+        if args.watch:
+            print("Watching for changes (press Ctrl+C to stop)...")
+            try:
+                watch_outputs(generator, args, tree_options)
+            except KeyboardInterrupt:
+                print("\nStopped watching.")
         else:
-            # Print to console
-            for line in tree_lines:
-                print(line)
-        
-        # Print statistics
-        print(f"\nStatistics:")
-        print(f"  Folders: {generator.stats['folders']}")
-        print(f"  Files: {generator.stats['files']}")
-        print(f"  Total Size: {generator.format_size(generator.stats['total_size'])}")
-        if generator.stats['truncated_folders'] > 0:
-            print(f"  Folders with truncated file lists: {generator.stats['truncated_folders']}")
+            write_outputs(generator, args, tree_options)
         
     except Exception as e:
         print(f"Error: {e}")
@@ -0,0 +1,486 @@
+#!/usr/bin/env python3
+"""
+Folder Tree Generator Benchmarks
+Builds a synthetic folder tree and times generate_tree under each combination of
+scan options, every renderer and the file classification, recording wall time,
+peak memory (tracemalloc) and filesystem syscall counts to a JSON file that later
+runs can be compared against.
+
+Examples:
+  python benchmark_folder_tree.py                          # default tree, benchmark_results.json
+  python benchmark_folder_tree.py --fan-out 10 --depth 3 --files 200 --hidden-ratio 0.3
+  python benchmark_folder_tree.py -o after.json --compare before.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import platform
+import tempfile
+import itertools
+import threading
+import subprocess
+import tracemalloc
+import argparse
+import ctypes
+import ctypes.util
+from pathlib import Path
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from Folder_Tree_Claude_shorter import (FolderTreeGenerator, TreeSnapshot,
+                                        PIL_AVAILABLE, REPORTLAB_AVAILABLE)
+
+# File name extensions of the synthetic tree (mostly ones the icon sets know, a
+# compound one and none); .tmp files are what the tree's .gitignore ignores
+EXTENSIONS = ('.py', '.py', '.md', '.txt', '.json', '.csv', '.ipynb', '.js', '.html', '.png',
+              '.jpg', '.pdf', '.mp3', '.zip', '.tar.gz', '.tmp', '.dat', '')
+KEY_FOLDER_NAMES = ('src', 'tests', 'docs', 'data', 'scripts', 'notebooks')
+NAME_CHARS = 'abcdefghijklmnopqrstuvwxyz0123456789_-'
+
+# Scan options benchmarked in every combination; walkers are generator settings
+SCAN_AXES = {
+    'show_size': (False, True),
+    'show_hidden': (False, True),
+    'max_files': (None, 10),
+    'walker': ('serial', 'threads', 'processes'),
+}
+WALKERS = {'serial': {}, 'threads': {'workers': 4}, 'processes': {'processes': 2}}
+
+# Exclude patterns for the exclude case: many that never match plus one glob that does
+EXCLUDE_PATTERNS = {f'nomatch{i:03d}' for i in range(200)} | {'*.dat'}
+
+def build_tree(root: Path, fan_out: int, depth: int, files: int, hidden_ratio: float,
+               name_length: Tuple[int, int], seed: int = 0) -> Dict[str, int]:
+    """Create a synthetic tree below root and return its folder, file and byte counts.
+    
+    Every folder holds files files and, above depth, fan_out subfolders. A share of
+    hidden_ratio of the names start with a dot. File sizes are set with truncate, so
+    the files take no disk space on filesystems with sparse files (tmpfs included).
+    """
+    rng = random.Random(seed)
+    counts = {'folders': 0, 'files': 0, 'bytes': 0}
+    
+    def new_name(used: set, ext: str = '', key_folder: bool = False) -> str:
+        while True:
+            if key_folder:
+                name = rng.choice(KEY_FOLDER_NAMES)
+            else:
+                name = ''.join(rng.choice(NAME_CHARS) for _ in range(rng.randint(*name_length))) + ext
+                if rng.random() < hidden_ratio:
+                    name = '.' + name
+            if name not in used:
+                used.add(name)
+                return name
+            key_folder = False
+    
+    def fill(directory: Path, level: int) -> None:
+        used = set()
+        for _ in range(files):
+            size = rng.randrange(64 * 1024)
+            with open(directory / new_name(used, rng.choice(EXTENSIONS)), 'wb') as f:
+                f.truncate(size)
+            counts['files'] += 1
+            counts['bytes'] += size
+        if level < depth:
+            for _ in range(fan_out):
+                subfolder = directory / new_name(used, key_folder=rng.random() < 0.1)
+                subfolder.mkdir()
+                counts['folders'] += 1
+                fill(subfolder, level + 1)
+    
+    root.mkdir(parents=True, exist_ok=True)
+    (root / '.gitignore').write_text('*.tmp\n', encoding='utf-8')
+    fill(root, 0)
+    return counts
+
+class SyscallCounter:
+    """Counts the filesystem calls made while active, in this process and its threads.
+    
+    read and write are the kernel's own counts (/proc/self/io, Linux only). The
+    others count calls into os and os.DirEntry that can reach the kernel:
+    DirEntry.stat only does so on its first call per entry and is_dir/is_file only
+    for symlinks or an unknown d_type, so those are upper bounds. Worker processes
+    (--processes) are not counted.
+    """
+    
+    # Qualified names of the C functions counted (methods arrive bound, so not by identity)
+    CALLS = {'scandir': 'scandir', 'listdir': 'listdir', 'stat': 'stat', 'lstat': 'lstat', 'open': 'open',
+             'DirEntry.stat': 'entry_stat', 'DirEntry.is_dir': 'entry_is_dir', 'DirEntry.is_file': 'entry_is_file'}
+    
+    def __init__(self):
+        self.counts = dict.fromkeys(self.CALLS.values(), 0)
+        self._kernel_start = None
+    
+    def _profile(self, frame, event, arg) -> None:
+        if event == 'c_call':
+            name = self.CALLS.get(getattr(arg, '__qualname__', None))
+            if name is not None:
+                self.counts[name] += 1
+    
+    @staticmethod
+    def _kernel_counts() -> Optional[Dict[str, int]]:
+        try:
+            with open('/proc/self/io', encoding='ascii') as f:
+                fields = dict(line.split(': ') for line in f.read().splitlines())
+            return {'read': int(fields['syscr']), 'write': int(fields['syscw'])}
+        except (OSError, KeyError, ValueError):
+            return None
+    
+    def __enter__(self) -> 'SyscallCounter':
+        self._kernel_start = self._kernel_counts()
+        threading.setprofile(self._profile)
+        sys.setprofile(self._profile)
+        return self
+    
+    def __exit__(self, *exc_info) -> None:
+        sys.setprofile(None)
+        threading.setprofile(None)
+        kernel_end = self._kernel_counts()
+        if self._kernel_start is not None and kernel_end is not None:
+            for name, value in kernel_end.items():
+                self.counts[name] = value - self._kernel_start[name]
+
+def _load_libc():
+    """glibc (for malloc_trim), or None elsewhere"""
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'))
+        libc.malloc_trim
+    except (OSError, AttributeError, TypeError):
+        return None
+    return libc
+
+_LIBC = _load_libc()
+
+def process_memory(field: str) -> Optional[int]:
+    """A memory field of /proc/self/status (VmRSS, VmHWM...) in bytes, or None where there is none"""
+    try:
+        with open('/proc/self/status', encoding='ascii') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+def reset_peak_rss() -> Optional[int]:
+    """Reset the process's peak RSS to its current RSS and return that, or None if not supported (Linux only)
+    
+    Memory freed by earlier cases is first handed back to the OS (glibc's malloc_trim),
+    otherwise a case reusing it (e.g. an L image after an RGB one) shows no growth.
+    """
+    if _LIBC is not None:
+        _LIBC.malloc_trim(0)
+    try:
+        with open('/proc/self/clear_refs', 'w', encoding='ascii') as f:
+            f.write('5')
+    except OSError:
+        return None
+    return process_memory('VmRSS')
+
+def measure(run: Callable[[], object], repeat: int,
+            setup: Optional[Callable[[], None]] = None) -> Tuple[Dict, object]:
+    """Time repeat runs of run(), then trace its memory and count its syscalls in one more run each.
+    
+    setup (if given) is called before every run, untimed. The last timed run also
+    records how far the process's peak RSS rose above its RSS at the start, which
+    includes memory tracemalloc cannot see (such as PIL's image buffers).
+    Returns the measurements and what the last timed run returned.
+    """
+    times = []
+    result = None
+    rss_growth = None
+    for i in range(repeat):
+        if setup:
+            setup()
+        rss_start = reset_peak_rss() if i == repeat - 1 else None
+        start = time.perf_counter()
+        result = run()
+        times.append(time.perf_counter() - start)
+        if rss_start is not None:
+            rss_growth = process_memory('VmHWM') - rss_start
+    
+    if setup:
+        setup()
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    
+    if setup:
+        setup()
+    with SyscallCounter() as calls:
+        run()
+    
+    return {'wall_s': min(times), 'wall_runs': times, 'peak_bytes': peak, 'peak_rss_growth_bytes': rss_growth,
+            'syscalls': calls.counts}, result
+
+def scan_cases(tree_root: Path, max_depth: int, work_dir: Path) -> Iterable[Tuple[str, Dict, Dict, Optional[Callable]]]:
+    """Yield (case, generator options, tree options, setup) for every scan benchmarked"""
+    for values in itertools.product(*SCAN_AXES.values()):
+        combination = dict(zip(SCAN_AXES, values))
+        generator_options = dict(max_depth=max_depth, max_files_per_folder=combination['max_files'],
+                                 **WALKERS[combination['walker']])
+        tree_options = dict(show_size=combination['show_size'], show_hidden=combination['show_hidden'])
+        name = '+'.join([key for key in ('show_size', 'show_hidden') if combination[key]] +
+                        (['max_files'] if combination['max_files'] else []) + [combination['walker']])
+        yield name, generator_options, tree_options, None
+    
+    yield 'max_files+largest', dict(max_depth=max_depth, max_files_per_folder=10, file_order='largest'), {}, None
+    yield 'exclude_patterns', dict(max_depth=max_depth), dict(exclude_patterns=EXCLUDE_PATTERNS), None
+    yield 'include_categories', dict(max_depth=max_depth), dict(include_categories={'code'}), None
+    yield 'gitignore', dict(max_depth=max_depth, respect_gitignore=True), {}, None
+    
+    cache_path = work_dir / 'scan_cache.db'
+    
+    def warm_cache():
+        if not cache_path.exists():
+            FolderTreeGenerator(max_depth=max_depth, cache_path=str(cache_path)).generate_tree(str(tree_root))
+    yield 'scan_cache (warm)', dict(max_depth=max_depth, cache_path=str(cache_path)), {}, warm_cache
+
+def bench_scans(tree_root: Path, max_depth: int, work_dir: Path, repeat: int) -> List[Dict]:
+    """Time generate_tree under each scan case, plus iter_tree streaming"""
+    results = []
+    for case, generator_options, tree_options, setup in scan_cases(tree_root, max_depth, work_dir):
+        generator = FolderTreeGenerator(**generator_options)
+        measured, _ = measure(lambda: generator.generate_tree(str(tree_root), **tree_options), repeat, setup)
+        entries = len(generator.model)
+        options = dict(generator_options, **{key: sorted(value) if isinstance(value, set) else value
+                                             for key, value in tree_options.items()})
+        results.append(dict(group='scan', case=case, options=options, entries=entries,
+                            entries_per_s=entries / measured['wall_s'],
+                            bytes_per_entry=generator.model.bytes_per_entry(), **measured))
+        report(results[-1])
+    
+    # Streaming keeps no model, so its memory peak should stay flat
+    generator = FolderTreeGenerator(max_depth=max_depth)
+    measured, entries = measure(lambda: sum(1 for _ in generator.iter_tree(str(tree_root))), repeat)
+    results.append(dict(group='scan', case='iter_tree (streamed)', options=dict(max_depth=max_depth),
+                        entries=entries, entries_per_s=entries / measured['wall_s'], **measured))
+    report(results[-1])
+    return results
+
+def bench_renderers(tree_root: Path, render_depth: int, render_max_files: int, out_dir: Path,
+                    repeat: int) -> List[Dict]:
+    """Time every output format on one scan of the tree (limited so PNG and PDF stay quick)"""
+    generator = FolderTreeGenerator(icon_set='artisanal', max_depth=render_depth,
+                                    max_files_per_folder=render_max_files)
+    generator.generate_tree(str(tree_root), show_size=True)
+    lines = len(generator.tree_lines)
+    snapshot_path = out_dir / 'tree.snap'
+    
+    def snapshot_to_text():
+        reader = FolderTreeGenerator(icon_set='artisanal')
+        reader.load_snapshot(str(snapshot_path))
+        reader.save_text(str(out_dir / 'from_snapshot.txt'))
+        reader.model.close()
+    
+    cases = [('text', 'tree.txt', None, lambda path: generator.save_text(path))]
+    for mode in FolderTreeGenerator.PNG_MODES:
+        cases.append((f'png {mode}', f'tree-{mode}.png', 'PIL',
+                      lambda path, mode=mode: generator.save_png(path, mode=mode, processes=1)))
+    processes = min(4, os.cpu_count() or 1)
+    if processes > 1:
+        cases.append((f'png RGB (processes={processes})', 'tree-procs.png', 'PIL',
+                       lambda path: generator.save_png(path, processes=processes)))
+    cases += [
+        ('png pages (A4, 150 dpi, mode 1)', 'pages.png', 'PIL',
+         lambda path: generator.save_png_pages(path, mode='1', processes=1)),
+        ('pdf', 'tree.pdf', 'reportlab', lambda path: generator.save_pdf(path)),
+        ('json', 'tree.json', None, lambda path: generator.save_json(path, root_path=str(tree_root))),
+        ('ndjson', 'tree.ndjson', None, lambda path: generator.save_json(path, root_path=str(tree_root))),
+        ('snapshot', 'tree.snap', None, lambda path: generator.save_snapshot(path, root_path=str(tree_root))),
+        ('snapshot load + text', 'from_snapshot.txt', None, lambda path: snapshot_to_text()),
+    ]
+    available = {'PIL': PIL_AVAILABLE, 'reportlab': REPORTLAB_AVAILABLE}
+    
+    results = []
+    for case, file_name, needs, render in cases:
+        if needs and not available[needs]:
+            results.append(dict(group='render', case=case, skipped=f"{needs} is not installed"))
+            report(results[-1])
+            continue
+        
+        path = out_dir / file_name
+        measured, _ = measure(lambda: render(str(path)), repeat)
+        written = [p for p in out_dir.iterdir() if p.name == file_name or
+                   (case.startswith('png pages') and p.name.startswith('pages-'))]
+        results.append(dict(group='render', case=case, lines=lines, lines_per_s=lines / measured['wall_s'],
+                            output_bytes=sum(p.stat().st_size for p in written), **measured))
+        report(results[-1])
+    
+    for result in results:
+        if result['case'] == 'snapshot':
+            with TreeSnapshot(str(snapshot_path)) as snapshot:
+                result['bytes_per_entry'] = snapshot.bytes_per_entry()
+    return results
+
+def reference_classify(generator: FolderTreeGenerator, path: Path, include_categories: set) -> Tuple[str, bool]:
+    """Icon and category filter as first written, for comparison: a stat per call,
+    a key-folder set rebuilt per call and a linear scan of the categories"""
+    if path.is_dir():
+        key_dirs = set(FolderTreeGenerator.KEY_DIRECTORIES)
+        return generator.icon_set.get('key_folder' if path.name.lower() in key_dirs else 'folder', '📁'), True
+    ext = path.suffix.lower()
+    icon = generator.icon_set.get(ext, generator.icon_set.get('file', '📄'))
+    included = any(ext in generator.file_categories.get(category, set()) for category in include_categories)
+    return icon, included
+
+def bench_classification(tree_root: Path, repeat: int) -> List[Dict]:
+    """Classify every entry of the tree by name (icon, category, key folder) against the reference"""
+    generator = FolderTreeGenerator(icon_set='artisanal')
+    entries = []
+    for path, folders, files in os.walk(tree_root):
+        entries += [(name, True) for name in folders] + [(name, False) for name in files]
+    paths = [Path(path) / name for path, folders, files in os.walk(tree_root) for name in folders + files]
+    include = {'code'}
+    
+    def classify():
+        for name, is_dir in entries:
+            if is_dir:
+                generator._icon_for(name, True, generator.is_key_directory(name))
+            else:
+                generator.classify_file(name)
+    
+    def reference():
+        for path in paths:
+            reference_classify(generator, path, include)
+    
+    results = []
+    for case, run in (('classify (table)', classify), ('classify (reference: stat + scans)', reference)):
+        measured, _ = measure(run, repeat)
+        results.append(dict(group='classify', case=case, entries=len(entries),
+                            ns_per_entry=measured['wall_s'] / len(entries) * 1e9, **measured))
+        report(results[-1])
+    return results
+
+def report(result: Dict) -> None:
+    """Print one result as a table row"""
+    name = f"{result['group']:<9} {result['case']:<42}"
+    if 'skipped' in result:
+        print(f"{name} skipped: {result['skipped']}")
+        return
+    calls = result['syscalls']
+    rss = result['peak_rss_growth_bytes']
+    print(f"{name} {result['wall_s'] * 1e3:10.1f} ms  peak {result['peak_bytes'] / 1024 / 1024:7.1f} MB"
+          f"  rss +{'?' if rss is None else f'{rss / 1024 / 1024:.1f}':>6} MB"
+          f"  scandir {calls['scandir']:>6}  stat {calls['stat'] + calls['entry_stat']:>8}")
+
+def compare(results: List[Dict], baseline_path: str) -> None:
+    """Print each case's wall time and peak memory against a previous results file"""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {(r['group'], r['case']): r for r in json.load(f)['results'] if 'skipped' not in r}
+    print(f"\nCompared with {baseline_path} (ratio < 1 is faster / smaller):")
+    for result in results:
+        before = baseline.get((result['group'], result['case']))
+        if before is None or 'skipped' in result:
+            continue
+        print(f"{result['group']:<9} {result['case']:<42} "
+              f"time {before['wall_s'] * 1e3:10.1f} -> {result['wall_s'] * 1e3:10.1f} ms "
+              f"({result['wall_s'] / before['wall_s']:5.2f}x)  "
+              f"peak {result['peak_bytes'] / max(before['peak_bytes'], 1):5.2f}x")
+
+def git_commit() -> Optional[str]:
+    """Commit of the checkout the generator was loaded from, if it is a git repository"""
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    """Main function with argument parsing"""
+    parser = argparse.ArgumentParser(
+        description="Benchmark the Folder Tree Generator on a synthetic tree",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  %(prog)s                                          # Default tree, all benchmarks
+  %(prog)s --fan-out 4 --depth 6 --files 50         # Deeper, narrower tree
+  %(prog)s --only scan -o scan.json                 # Scans only
+  %(prog)s -o after.json --compare before.json      # Compare with an earlier run
+        """
+    )
+    
+    parser.add_argument('-o', '--output', default='benchmark_results.json',
+                       help='JSON results file (default: benchmark_results.json)')
+    parser.add_argument('--compare', metavar='BASELINE',
+                       help='Results file of an earlier run to compare with')
+    parser.add_argument('--only', nargs='+', choices=['scan', 'render', 'classify'],
+                       help='Run only these benchmark groups')
+    parser.add_argument('--root', metavar='DIR',
+                       help='Folder to build the tree in, as DIR/tree (default: a temporary folder, on tmpfs when available)')
+    parser.add_argument('--keep', action='store_true',
+                       help='Keep the synthetic tree and rendered outputs')
+    parser.add_argument('--fan-out', type=int, default=6, help='Subfolders per folder (default: 6)')
+    parser.add_argument('--depth', type=int, default=4, help='Levels of subfolders (default: 4)')
+    parser.add_argument('--files', type=int, default=20, help='Files per folder (default: 20)')
+    parser.add_argument('--hidden-ratio', type=float, default=0.1,
+                       help='Share of names starting with a dot (default: 0.1)')
+    parser.add_argument('--name-length', type=int, nargs=2, default=[4, 16], metavar=('MIN', 'MAX'),
+                       help='Range of name lengths, without extension (default: 4 16)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed for the tree (default: 0)')
+    parser.add_argument('--repeat', type=int, default=3,
+                       help='Timed runs per case; the fastest is reported (default: 3)')
+    parser.add_argument('--render-depth', type=int, default=4,
+                       help='Depth of the tree drawn by the renderers (default: 4)')
+    parser.add_argument('--render-max-files', type=int, default=5,
+                       help='Files per folder drawn by the renderers (default: 5)')
+    
+    args = parser.parse_args()
+    groups = args.only or ['scan', 'render', 'classify']
+    
+    shm = Path('/dev/shm')
+    if args.root:
+        work_dir = Path(args.root)
+        work_dir.mkdir(parents=True, exist_ok=True)
+    else:
+        work_dir = Path(tempfile.mkdtemp(prefix='folder_tree_bench_',
+                                         dir=shm if shm.is_dir() and os.access(shm, os.W_OK) else None))
+    tree_root = work_dir / 'tree'
+    out_dir = work_dir / 'outputs'
+    
+    try:
+        if tree_root.exists():
+            shutil.rmtree(tree_root)
+        print(f"Building synthetic tree in {tree_root}...")
+        spec = dict(fan_out=args.fan_out, depth=args.depth, files=args.files, hidden_ratio=args.hidden_ratio,
+                    name_length=tuple(args.name_length), seed=args.seed)
+        start = time.perf_counter()
+        counts = build_tree(tree_root, **spec)
+        print(f"  {counts['folders']} folders, {counts['files']} files in {time.perf_counter() - start:.1f}s\n")
+        out_dir.mkdir(exist_ok=True)
+        
+        # Scans read every level of the tree
+        max_depth = args.depth + 1
+        results = []
+        if 'scan' in groups:
+            results += bench_scans(tree_root, max_depth, work_dir, args.repeat)
+        if 'render' in groups:
+            results += bench_renderers(tree_root, args.render_depth, args.render_max_files, out_dir, args.repeat)
+        if 'classify' in groups:
+            results += bench_classification(tree_root, args.repeat)
+    finally:
+        if not args.keep and not args.root:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump({'generated': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                   'environment': {'python': platform.python_version(), 'platform': platform.platform(),
+                                   'cpus': os.cpu_count(), 'commit': git_commit(),
+                                   'tree_root': str(tree_root)},
+                   'tree': dict(spec, counts=counts), 'repeat': args.repeat,
+                   'results': results}, f, indent=2)
+    print(f"\nResults saved to {args.output}")
+    
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == "__main__":
+    main()